@@ -0,0 +1,266 @@
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, set_start_method
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, where peak memory is not measured
+    resource = None
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+COMMAND_LINE_TOOL = os.path.join(CODE_DIR, 'MarMAT-CommandLine-2.6.py')
+ENGINES = ['automaton', 'vectorized', 'lcsh', 'regex']
+DEFAULT_ENGINES = ['automaton', 'vectorized', 'lcsh']  # regex takes hours at the default sizes, so it is only run on request
+
+# Vocabulary resembling the example metadata, used to build synthetic records
+WORDS = ['photo', 'photograph', 'showing', 'group', 'people', 'dancers', 'chief', 'family', 'home', 'exterior',
+         'interior', 'street', 'view', 'portrait', 'members', 'church', 'school', 'river', 'mountain', 'valley',
+         'canyon', 'mine', 'railroad', 'station', 'festival', 'parade', 'building', 'farm', 'ranch', 'camp',
+         'students', 'workers', 'women', 'men', 'children', 'visit', 'celebration', 'meeting', 'ceremony', 'print',
+         'block', 'pine', 'basin', 'towel', 'horse', 'talisman', 'series', 'approximate', 'size', 'holding']
+PLACES = ['Salt Lake City (Utah)', 'Ogden (Utah)', 'Provo (Utah)', 'Moab (Utah)', 'Tokyo (Japan)', 'Hokkaido (Japan)',
+          'Taiwan', 'Navajo Mountain (Utah and Ariz.)', 'Bonneville Salt Flats (Utah)', 'Monument Valley (Ariz. and Utah)']
+SUBDIVISIONS = ['Photographs', 'History', 'Social life and customs', 'Art', 'Monuments', 'Buildings, structures, etc.',
+                'Politics and government', 'Religion', '20th century', 'Description and travel']
+CREATORS = ['Tierney, Lennox', 'Swindle, JoAnne C.', 'Shipler Commercial Photographers', 'Hanson, Ken', 'Unknown']
+COLLECTIONS = ['P0479 Lennox and Catherine Tierney Photo Collection', 'P0827 JoAnne C. Swindle photograph collection',
+               'Shipler Commercial Photographers Collection', 'Utah Historical Society Collection']
+
+
+def load_command_line_tool():
+    """Import the MaRMAT command-line tool as a module."""
+    spec = importlib.util.spec_from_file_location('marmat', COMMAND_LINE_TOOL)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['marmat'] = module  # Lets worker processes unpickle the compiled lexicon
+    spec.loader.exec_module(module)
+    return module
+
+
+def generate_lexicon(size, rng):
+    """Generate a lexicon of the given size from the provided lexicons plus synthetic terms.
+
+    Parameters:
+    size (int): Number of terms.
+    rng (numpy.random.Generator): Random number generator.
+
+    Returns:
+    pandas.DataFrame: Lexicon with 'term' and 'category' columns.
+
+    """
+    frames = [pd.read_csv(os.path.join(CODE_DIR, name), encoding='latin1')
+              for name in ('lexicon-reparative-metadata.csv', 'lexicon-LCSH.csv')]
+    lexicon_df = pd.concat(frames, ignore_index=True).head(size)
+    missing = size - len(lexicon_df)
+    if missing > 0:
+        # Synthetic two-word phrases with a number, which do not occur in the synthetic records unless planted
+        first = rng.choice(WORDS, missing)
+        second = rng.choice(WORDS, missing)
+        numbers = rng.integers(0, 1_000_000, missing)
+        terms = [f"{a} {b} {n}" for a, b, n in zip(first, second, numbers)]
+        categories = [f"Synthetic{n % 10}" for n in numbers]
+        lexicon_df = pd.concat([lexicon_df, pd.DataFrame({'term': terms, 'category': categories})], ignore_index=True)
+    return lexicon_df
+
+
+def generate_metadata(rows, lexicon_df, rng, term_rate=0.05):
+    """Generate synthetic metadata resembling example-input-metadata.csv.
+
+    Parameters:
+    rows (int): Number of records.
+    lexicon_df (pandas.DataFrame): Lexicon whose terms are planted in some titles, descriptions and subjects.
+    rng (numpy.random.Generator): Random number generator.
+    term_rate (float): Share of titles, descriptions and subjects that contain a lexicon term.
+
+    Returns:
+    pandas.DataFrame: Metadata with the columns of the example file.
+
+    """
+    terms = lexicon_df['term'].to_numpy(dtype=object)
+
+    def phrases(count, low, high):
+        lengths = rng.integers(low, high, count)
+        words = rng.choice(WORDS, int(lengths.sum()))
+        ends = np.cumsum(lengths)
+        return [' '.join(words[end - length:end]) for end, length in zip(ends, lengths)]
+
+    def plant(texts, separator=' '):
+        planted = np.flatnonzero(rng.random(len(texts)) < term_rate)
+        for position, term in zip(planted, rng.choice(terms, len(planted))):
+            texts[position] = f"{texts[position]}{separator}{term}"
+        return texts
+
+    titles = plant([text.capitalize() for text in phrases(rows, 2, 6)])
+    descriptions = plant(phrases(rows, 8, 30))
+    places = rng.choice(PLACES, rows)
+    subdivisions = rng.choice(SUBDIVISIONS, (rows, 2))
+    subjects = plant([f"{place}--{first}; {second.capitalize()}--{place}; {place}"
+                      for place, (first, second) in zip(places, subdivisions)], separator='; ')
+    return pd.DataFrame({
+        'id': np.arange(100000, 100000 + rows),
+        'title': titles,
+        'description': descriptions,
+        'creator': rng.choice(CREATORS, rows),
+        'date': rng.integers(1900, 2010, rows).astype(str),
+        'collection name': rng.choice(COLLECTIONS, rows),
+        'subjects': subjects,
+        'spatial coverage': places,
+    })
+
+
+def generate_collection(rows, lexicon_size, seed):
+    """Generate a synthetic lexicon and collection; the same sizes and seed always give the same data.
+
+    Returns:
+    tuple: The metadata and the lexicon data frames.
+
+    """
+    rng = np.random.default_rng(seed)
+    lexicon_df = generate_lexicon(lexicon_size, rng)
+    return generate_metadata(rows, lexicon_df, rng), lexicon_df
+
+
+def prepare_tool(marmat, metadata_df, lexicon_df, engine, workers):
+    """Set up the command-line tool to match a synthetic collection with one engine.
+
+    Returns:
+    tuple: The tool, the columns to match and the categories to match.
+
+    """
+    tool = marmat.MaRMAT()
+    tool.lexicon_df = lexicon_df
+    tool.metadata_df = metadata_df
+    tool.select_identifier_column('id')
+    tool.select_engine(engine)
+    tool.select_workers(workers)
+    columns = [col for col in metadata_df.columns if col != 'id']
+    categories = lexicon_df['category'].unique().tolist()
+    return tool, columns, categories
+
+
+def peak_rss(who):
+    """Return the peak resident set size, in bytes, of this process (resource.RUSAGE_SELF) or of the largest
+    of its finished child processes (resource.RUSAGE_CHILDREN)."""
+    peak = resource.getrusage(who).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # Reported in kilobytes except on macOS
+
+
+def measure_memory(rows, lexicon_size, seed, engine, workers):
+    """Match a synthetic collection in this newly started process and return the peak memory it took.
+
+    The collection is generated again here from its sizes and seed rather than sent from the parent
+    process, which would pickle every record. Resident set sizes are read from the operating system, so
+    they include memory that Python does not allocate itself, such as numpy and Arrow buffers, and the
+    worker processes are measured separately.
+
+    Returns:
+    dict: Peak resident set size of this process before matching (the interpreter, libraries and the
+    collection, including generating it) and after matching, and of the largest worker process, or None
+    without workers.
+
+    """
+    # Worker processes must inherit the tool, which is loaded from a file and cannot be imported by name
+    set_start_method('fork', force=True)
+    metadata_df, lexicon_df = generate_collection(rows, lexicon_size, seed)
+    tool, columns, categories = prepare_tool(load_command_line_tool(), metadata_df, lexicon_df, engine, workers)
+    baseline = peak_rss(resource.RUSAGE_SELF)
+    tool.find_matches(columns, categories)
+    return {
+        'baseline_rss_bytes': baseline,
+        'peak_rss_bytes': peak_rss(resource.RUSAGE_SELF),
+        'peak_worker_rss_bytes': peak_rss(resource.RUSAGE_CHILDREN) if tool.workers > 1 and engine != 'regex' else None,
+    }
+
+
+def run_engine(marmat, metadata_df, lexicon_df, engine, workers, seed, measure=True):
+    """Time one matching engine on one synthetic collection.
+
+    The peak resident set size only ever grows over the life of a process, so the peak memory is measured
+    in a second run of the engine, in a newly started process (see measure_memory), which generates the
+    collection again from its sizes and the seed it was generated with.
+
+    Returns:
+    dict: Wall time, throughput and peak memory of the run.
+
+    """
+    tool, columns, categories = prepare_tool(marmat, metadata_df, lexicon_df, engine, workers)
+    start = time.perf_counter()
+    matches = tool.find_matches(columns, categories)
+    wall_seconds = time.perf_counter() - start
+
+    memory = {'baseline_rss_bytes': None, 'peak_rss_bytes': None, 'peak_worker_rss_bytes': None}
+    if measure and resource is not None:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+            memory = pool.submit(measure_memory, len(metadata_df), len(lexicon_df), seed, engine, workers).result()
+
+    return {
+        'engine': engine,
+        'workers': workers,
+        'rows': len(metadata_df),
+        'lexicon_terms': len(lexicon_df),
+        'matches': len(matches),
+        'wall_seconds': round(wall_seconds, 4),
+        'rows_per_second': round(len(metadata_df) / wall_seconds, 1) if wall_seconds else None,
+        'matches_per_second': round(len(matches) / wall_seconds, 1) if wall_seconds else None,
+        **memory,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the MaRMAT matching engines on synthetic collections.")
+    parser.add_argument("--rows", type=int, nargs='+', default=[10_000, 100_000],
+                        help="collection sizes to generate, in records (e.g. 10000 1000000 10000000)")
+    parser.add_argument("--lexicon-sizes", type=int, nargs='+', default=[100, 1_000],
+                        help="lexicon sizes to generate, in terms (e.g. 100 5000 50000)")
+    parser.add_argument("--engines", nargs='+', choices=ENGINES, default=DEFAULT_ENGINES,
+                        help="matching engines to run (default: all but 'regex', which searches one term at a time "
+                             "and takes hours at the default sizes; run it with small --rows and --lexicon-sizes)")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes used for matching")
+    parser.add_argument("--skip-memory", action="store_true",
+                        help="skip the second run of each engine, in a separate process, that measures peak memory")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic data generator")
+    parser.add_argument("--output", default="benchmark-results.json", help="path of the JSON results file")
+    args = parser.parse_args()
+
+    marmat = load_command_line_tool()
+    results = []
+    for lexicon_size in args.lexicon_sizes:
+        for rows in args.rows:
+            metadata_df, lexicon_df = generate_collection(rows, lexicon_size, args.seed)
+            for engine in args.engines:
+                result = run_engine(marmat, metadata_df, lexicon_df, engine, args.workers, args.seed, not args.skip_memory)
+                results.append(result)
+                line = (f"{engine:>10} | {rows:>9} rows | {lexicon_size:>6} terms | {result['wall_seconds']:>9.2f} s | "
+                        f"{result['rows_per_second']} rows/s | {result['matches']} matches")
+                if result['peak_rss_bytes'] is not None:
+                    line += f" | {result['peak_rss_bytes'] / 2 ** 20:.0f} MB peak RSS"
+                if result['peak_worker_rss_bytes'] is not None:
+                    line += f" ({result['peak_worker_rss_bytes'] / 2 ** 20:.0f} MB largest worker)"
+                print(line)
+
+    report = {
+        'environment': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'seed': args.seed,
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as output:
+        json.dump(report, output, indent=2)
+    print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,125 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-import pandas as pd
-import re
 import threading
+import queue
+import os
+import json
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from marmat_engine import (LexiconMatcher, Profiler, detect_encoding, dictionary_codes, init_worker, lazy_import, match_columns,
+                           match_shard, metadata_dtypes, read_csv, read_header)
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+MATCH_BLOCK_ROWS = 10000  # Rows matched between progress updates and checks for cancellation
+RESULT_COLUMNS = ['Identifier', 'Term', 'Category', 'Column', 'Start', 'End']  # Followed by 'Count' if selected, then 'Original Text' or 'Context'
+DEFAULT_CONTEXT_CHARS = 40  # Characters shown on either side of a match when context snippets are selected
+RESULTS_PAGE_SIZE = 200  # Matches shown per page of the results viewer
+
+
+class ResultStore:
+    """Keeps the matches of a run in a temporary SQLite database, so the results viewer can page, sort
+    and filter millions of matches without holding them in Tk widgets."""
+
+    def __init__(self, matches_df):
+        """Write the matches to a new temporary database and index the columns used for sorting and filtering."""
+        handle, self.path = tempfile.mkstemp(prefix='marmat-results-', suffix='.sqlite')
+        os.close(handle)
+        # The store is filled on the matching thread and read on the Tk thread, never at the same time
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode = OFF')  # A scratch copy of the results needs no crash safety
+        self.connection.execute('PRAGMA synchronous = OFF')
+        self.columns = list(matches_df.columns)
+        frame = matches_df.copy()
+        frame['Identifier'] = frame['Identifier'].astype(object)
+        frame.to_sql('matches', self.connection, index=False, chunksize=50000)
+        for column in ('Identifier', 'Term', 'Category', 'Column'):
+            self.connection.execute(f'CREATE INDEX "matches_{column}" ON matches ("{column}")')
+        self.connection.commit()
+
+    def _where(self, filters):
+        """Build the WHERE clause selecting the matches of exact column values and a term substring."""
+        clauses, parameters = [], []
+        for column, value in filters.items():
+            if not value:
+                continue
+            if column == 'Term':
+                clauses.append('"Term" LIKE ? ESCAPE \'\\\'')
+                parameters.append('%' + value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+            else:
+                clauses.append(f'"{column}" = ?')
+                parameters.append(value)
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), parameters
+
+    def count(self, filters):
+        """Count the matches passing the filters."""
+        where, parameters = self._where(filters)
+        return self.connection.execute(f'SELECT COUNT(*) FROM matches{where}', parameters).fetchone()[0]
+
+    def page(self, filters, sort_column=None, descending=False, offset=0, limit=RESULTS_PAGE_SIZE):
+        """Fetch one page of the matches passing the filters, in match order or sorted by a column."""
+        where, parameters = self._where(filters)
+        direction = 'DESC' if descending else 'ASC'
+        order = f'"{sort_column}" {direction}, rowid {direction}' if sort_column else 'rowid'
+        columns = ', '.join(f'"{column}"' for column in self.columns)
+        query = f'SELECT {columns} FROM matches{where} ORDER BY {order} LIMIT ? OFFSET ?'
+        return self.connection.execute(query, parameters + [limit, offset]).fetchall()
+
+    def distinct(self, column):
+        """List the distinct values of a column, for the filter choices."""
+        return [value for (value,) in self.connection.execute(f'SELECT DISTINCT "{column}" FROM matches ORDER BY "{column}"')]
+
+    def close(self):
+        """Close and delete the database."""
+        self.connection.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def _context_snippet(text, start, end, context):
+    """Cut a text down to a span and up to context characters on either side, marking the cut ends with '...'."""
+    left = max(0, start - context)
+    right = min(len(text), end + context)
+    return ('...' if left else '') + text[left:right] + ('...' if right < len(text) else '')
+
+
+def _no_matches():
+    """Return the empty match arrays: rows, columns, term indexes, start and end offsets, occurrences, and snippets."""
+    return tuple(np.empty(0, dtype=np.int64) for _ in range(6)) + (np.empty(0, dtype=object),)
+
+
+def _match_frame(frame, selected_columns, matcher, offset=0, profiler=None, context=None):
+    """Match the selected columns of a metadata frame column by column.
+
+    Returns arrays of row positions (shifted by offset), selected column positions, term indexes, the
+    start and end offsets of each match in its cell, and its number of occurrences in the cell. If context is a number of characters, a context snippet
+    around each match is cut during the same scan and returned in a last array, which is empty otherwise.
+    If a profiler is given, it records the time spent factorizing and matching each column.
+    """
+    def match_values(uniques):
+        positions, term_ids, starts, ends, occurrences, snippets = [], [], [], [], [], []
+        for position, text in enumerate(uniques.tolist()):
+            # A single scan finds every term within a single metadata cell, along with where and how often it occurs
+            for term_index, start, end, count in matcher.find_spans(text):
+                positions.append(position)
+                term_ids.append(term_index)
+                starts.append(start)
+                ends.append(end)
+                occurrences.append(count)
+                if context is not None:
+                    snippets.append(_context_snippet(text, start, end, context))
+        found = tuple(np.asarray(values, dtype=np.int64) for values in (positions, term_ids, starts, ends, occurrences))
+        return found + (np.asarray(snippets, dtype=object),) if context is not None else found
+
+    matches = match_columns(frame, selected_columns, match_values, offset, profiler)
+    return matches if context is not None else matches + (np.empty(0, dtype=object),)
+
 
 class MaRMAT(tk.Tk):
     def __init__(self):
@@ -12,10 +129,16 @@ class MaRMAT(tk.Tk):
         # Initialize variables
         self.lexicon_df = None
         self.metadata_df = None
+        self.metadata_path = None  # Only the header is read when loading; rows are read when matching starts
+        self.metadata_encoding = 'utf-8'  # Encoding of the metadata file, detected when it is loaded
         self.columns = []
         self.categories = []
         self.selected_columns = []
         self.identifier_column = None
+        self.profiler = Profiler()  # Timing of the current run, shown in the diagnostics panel
+        self.matching_thread = None  # Background thread running the current match
+        self.matching_queue = queue.Queue()  # Progress and results posted by the matching thread
+        self.cancel_event = threading.Event()  # Set to stop the current match early
         
         # Create main frame
         self.main_frame = ttk.Frame(self)
@@ -65,31 +188,72 @@ class MaRMAT(tk.Tk):
     def load_lexicon(self):
         file_path = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv")])
         if file_path:
-            try:
-                self.lexicon_df = pd.read_csv(file_path, encoding='latin1')
+            def read_lexicon():
+                with self.profiler.stage('load lexicon'):
+                    with open(file_path, 'rb') as lexicon_file:
+                        return read_csv(file_path, detect_encoding(lexicon_file))[0]
+
+            def loaded(lexicon_df):
+                self.lexicon_df = lexicon_df
                 messagebox.showinfo("Success", "Lexicon loaded successfully.")
-                self.load_lexicon_button.config(state='disabled')
-            except Exception as e:
-                messagebox.showerror("Error", f"An error occurred while loading lexicon: {e}")
+
+            self.load_lexicon_button.config(state='disabled')
+            self.run_in_background(read_lexicon, loaded, "An error occurred while loading lexicon",
+                                   lambda: self.load_lexicon_button.config(state='normal'))
     
     def load_metadata(self):
         file_path = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv")])
         if file_path:
-            try:
-                self.metadata_df = pd.read_csv(file_path, encoding='latin1')
+            def read_columns():
+                # Read the header only, so the column selection screen appears without parsing the whole file;
+                # the encoding is detected from the start of the file
+                with self.profiler.stage('load metadata'):
+                    return read_header(file_path)
+
+            def loaded(header):
+                self.columns, self.metadata_encoding = header
+                self.metadata_path = file_path
+                self.metadata_df = None
                 messagebox.showinfo("Success", "Metadata loaded successfully.")
-                self.load_metadata_button.config(state='disabled')
                 self.next_button.grid()
+
+            self.load_metadata_button.config(state='disabled')
+            self.run_in_background(read_columns, loaded, "An error occurred while loading metadata",
+                                   lambda: self.load_metadata_button.config(state='normal'))
+    
+    def run_in_background(self, work, on_success, error_message, on_error=None):
+        # Run work on a background thread so reading a file does not freeze the window, then hand its result
+        # to on_success, or show the error and call on_error, back on the Tk thread
+        results = queue.Queue()
+
+        def run():
+            try:
+                results.put(('done', work()))
             except Exception as e:
-                messagebox.showerror("Error", f"An error occurred while loading metadata: {e}")
+                results.put(('error', e))
+
+        def check():
+            try:
+                status, value = results.get_nowait()
+            except queue.Empty:
+                self.after(100, check)
+                return
+            if status == 'done':
+                on_success(value)
+            else:
+                messagebox.showerror("Error", f"{error_message}: {value}")
+                if on_error is not None:
+                    on_error()
+
+        threading.Thread(target=run, daemon=True).start()
+        self.after(100, check)
     
     def show_column_selection(self):
-        if self.lexicon_df is None or self.metadata_df is None:
+        if self.lexicon_df is None or self.metadata_path is None:
             messagebox.showwarning("Warning", "Please load lexicon and metadata files first.")
             return
         
         # Populate columns listbox
-        self.columns = self.metadata_df.columns.tolist()
         self.column_selection_frame = ttk.Frame(self)
         self.column_selection_frame.grid(row=0, column=0, padx=20, pady=20, sticky="nsew")
         
@@ -128,7 +292,7 @@ class MaRMAT(tk.Tk):
         self.identifier_var = tk.StringVar()
         self.identifier_dropdown = ttk.Combobox(self.identifier_selection_frame, textvariable=self.identifier_var, state='readonly')
         self.identifier_dropdown.grid(row=1, column=0, padx=10, pady=5, sticky="nsew")
-        self.identifier_dropdown['values'] = self.metadata_df.columns.tolist()  # Show all columns as options
+        self.identifier_dropdown['values'] = self.columns  # Show all columns as options
         self.identifier_dropdown.current(0)  # Select first column by default
         
         self.next_button_identifier = ttk.Button(self.identifier_selection_frame, text="Next", command=self.show_category_selection)
@@ -158,30 +322,295 @@ class MaRMAT(tk.Tk):
         self.all_categories_checkbox = ttk.Checkbutton(self.category_selection_frame, text="All", variable=self.all_categories_var, command=self.toggle_categories)
         self.all_categories_checkbox.grid(row=2, column=0, padx=10, pady=5, sticky="w")
         
+        # Number of worker processes used to share the matching work across CPU cores
+        self.workers_frame = ttk.Frame(self.category_selection_frame)
+        self.workers_frame.grid(row=3, column=0, padx=10, pady=5, sticky="w")
+        self.workers_label = ttk.Label(self.workers_frame, text="Worker processes:")
+        self.workers_label.grid(row=0, column=0, sticky="w")
+        self.workers_var = tk.IntVar(value=1)
+        self.workers_spinbox = ttk.Spinbox(self.workers_frame, from_=1, to=os.cpu_count() or 1, textvariable=self.workers_var, width=5)
+        self.workers_spinbox.grid(row=0, column=1, padx=5, sticky="w")
+        
+        # Context snippets around each match, shown and exported instead of the full text of the cell
+        self.context_frame = ttk.Frame(self.category_selection_frame)
+        self.context_frame.grid(row=4, column=0, padx=10, pady=5, sticky="w")
+        self.context_var = tk.BooleanVar(value=False)
+        self.context_checkbox = ttk.Checkbutton(self.context_frame, text="Show context instead of full text, characters:", variable=self.context_var)
+        self.context_checkbox.grid(row=0, column=0, sticky="w")
+        self.context_chars_var = tk.IntVar(value=DEFAULT_CONTEXT_CHARS)
+        self.context_spinbox = ttk.Spinbox(self.context_frame, from_=0, to=1000, textvariable=self.context_chars_var, width=5)
+        self.context_spinbox.grid(row=0, column=1, padx=5, sticky="w")
+        
+        self.variants_var = tk.BooleanVar(value=False)
+        self.variants_checkbox = ttk.Checkbutton(self.category_selection_frame, text="Match singular and plural forms of terms", variable=self.variants_var)
+        self.variants_checkbox.grid(row=5, column=0, padx=10, pady=5, sticky="w")
+        
+        self.fold_accents_var = tk.BooleanVar(value=False)
+        self.fold_accents_checkbox = ttk.Checkbutton(self.category_selection_frame, text="Ignore accents when matching", variable=self.fold_accents_var)
+        self.fold_accents_checkbox.grid(row=6, column=0, padx=10, pady=5, sticky="w")
+        
+        self.count_var = tk.BooleanVar(value=False)
+        self.count_checkbox = ttk.Checkbutton(self.category_selection_frame, text="Count occurrences of each term", variable=self.count_var)
+        self.count_checkbox.grid(row=7, column=0, padx=10, pady=5, sticky="w")
+        
+        self.diagnostics_var = tk.BooleanVar(value=False)
+        self.diagnostics_checkbox = ttk.Checkbutton(self.category_selection_frame, text="Show diagnostics after matching", variable=self.diagnostics_var)
+        self.diagnostics_checkbox.grid(row=8, column=0, padx=10, pady=5, sticky="w")
+        
         self.next_button_categories = ttk.Button(self.category_selection_frame, text="Perform Matching", command=self.perform_matching)
-        self.next_button_categories.grid(row=3, column=0, padx=10, pady=10, sticky="nsew")
+        self.next_button_categories.grid(row=9, column=0, padx=10, pady=10, sticky="nsew")
         
         self.back_button_categories = ttk.Button(self.category_selection_frame, text="Back", command=self.back_to_identifier_selection)
-        self.back_button_categories.grid(row=4, column=0, padx=10, pady=10, sticky="nsew")
+        self.back_button_categories.grid(row=10, column=0, padx=10, pady=10, sticky="nsew")
+        
+        # Progress of a running match, shown while matching
+        self.progress_bar = ttk.Progressbar(self.category_selection_frame, orient="horizontal", mode="determinate", maximum=100)
+        self.progress_bar.grid(row=11, column=0, padx=10, pady=5, sticky="nsew")
+        self.progress_label = ttk.Label(self.category_selection_frame, text="")
+        self.progress_label.grid(row=12, column=0, padx=10, pady=5, sticky="w")
+        self.cancel_button = ttk.Button(self.category_selection_frame, text="Cancel", command=self.cancel_matching)
+        self.cancel_button.grid(row=13, column=0, padx=10, pady=10, sticky="nsew")
+        for widget in (self.progress_bar, self.progress_label, self.cancel_button):
+            widget.grid_remove()  # Hide progress widgets until matching starts
     
     def perform_matching(self):
         selected_categories = self.get_selected_categories()
         if not selected_categories:
             messagebox.showwarning("Warning", "Please select at least one category.")
             return
+        if self.matching_thread is not None and self.matching_thread.is_alive():
+            return
+        
+        # Match on a background thread so the window stays responsive; Tk is only touched from this thread
+        workers = self.get_selected_workers()
+        context = self.get_selected_context()
+        count_occurrences = self.count_var.get()
+        variants = self.variants_var.get()
+        fold_accents = self.fold_accents_var.get()
+        self.cancel_event = threading.Event()
+        self.matching_queue = queue.Queue()
+        self.profiler = Profiler()  # The diagnostics of each run cover that run only
+        self.matching_progress = (0, 0)
+        self.matching_started = time.perf_counter()
+        self.next_button_categories.config(state='disabled')
+        self.back_button_categories.config(state='disabled')
+        self.cancel_button.config(state='normal')
+        self.progress_bar['value'] = 0
+        self.progress_label.config(text="Loading metadata...")
+        for widget in (self.progress_bar, self.progress_label, self.cancel_button):
+            widget.grid()
+        
+        def match_terms():
+            try:
+                self.load_selected_metadata()
+                self.matching_queue.put(('status', "Compiling lexicon..."))
+                matches_df = self.find_matches(self.selected_columns, selected_categories, workers,
+                                               progress=lambda done, total: self.matching_queue.put(('progress', done, total)),
+                                               cancel_event=self.cancel_event, context=context, count_occurrences=count_occurrences,
+                                               variants=variants, fold_accents=fold_accents)
+                self.matching_queue.put(('status', f"Preparing {len(matches_df):,} matches for viewing..."))
+                with self.profiler.stage('store results'):
+                    store = ResultStore(matches_df) if len(matches_df) else None
+                self.matching_queue.put(('done', (matches_df, store)))
+            except Exception as e:
+                self.matching_queue.put(('error', e))
+        
+        self.matching_thread = threading.Thread(target=match_terms, daemon=True)
+        self.matching_thread.start()
+        self.after(100, self.process_matching_queue)
+    
+    def load_selected_metadata(self):
+        # Read only the selected and identifier columns; low-cardinality text columns become categoricals,
+        # while columns read as numbers stay numeric so the same cells are matched as before
+        columns = list(dict.fromkeys(self.selected_columns + [self.identifier_column]))
+        if self.metadata_df is not None and all(col in self.metadata_df.columns for col in columns):
+            return
+        with self.profiler.stage('load metadata'):
+            dtypes, self.metadata_encoding = metadata_dtypes(self.metadata_path, columns, self.identifier_column,
+                                                             self.metadata_encoding)
+            self.metadata_df, self.metadata_encoding = read_csv(self.metadata_path, self.metadata_encoding, usecols=columns,
+                                                                dtype=dtypes)
+    
+    def process_matching_queue(self):
+        try:
+            while True:
+                message = self.matching_queue.get_nowait()
+                if message[0] == 'progress':
+                    self.show_matching_progress(*message[1:])
+                elif message[0] == 'status':
+                    self.progress_label.config(text=message[1])
+                else:
+                    self.finish_matching(*message)
+                    return
+        except queue.Empty:
+            self.after(100, self.process_matching_queue)
+    
+    def show_matching_progress(self, done, total):
+        self.matching_progress = (done, total)
+        elapsed = time.perf_counter() - self.matching_started
+        self.progress_bar['value'] = done / total * 100 if total else 100
+        if self.cancel_event.is_set():
+            return
+        text = f"{done:,} of {total:,} rows"
+        if done and elapsed > 0:
+            rate = done / elapsed
+            text += f" ({rate:,.0f} rows/s, about {(total - done) / rate:,.0f} s left)"
+        self.progress_label.config(text=text)
+    
+    def cancel_matching(self):
+        self.cancel_event.set()
+        self.cancel_button.config(state='disabled')
+        self.progress_label.config(text="Cancelling...")
+    
+    def finish_matching(self, status, result):
+        for widget in (self.progress_bar, self.progress_label, self.cancel_button):
+            widget.grid_remove()
+        self.next_button_categories.config(state='normal')
+        self.back_button_categories.config(state='normal')
+        if status == 'error':
+            messagebox.showerror("Error", f"An error occurred while matching: {result}")
+            return
         
-        matches = self.find_matches(self.selected_columns, selected_categories)
-        matches_filtered = [(identifier, term, category, col, text) for identifier, term, category, col, text in matches if col in self.selected_columns]
-        output_file_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv")])
+        matches_df, store = result
+        if self.cancel_event.is_set():
+            done, total = self.matching_progress
+            if store is None:
+                messagebox.showinfo("Matching Cancelled", f"Matching was cancelled after {done:,} of {total:,} rows. No matches were found.")
+                return
+            if not messagebox.askyesno("Matching Cancelled", f"Matching was cancelled after {done:,} of {total:,} rows. View the {len(matches_df):,} matches found so far?"):
+                store.close()
+                return
+        if store is None:
+            messagebox.showinfo("No Matches", "No matches found.")
+            if self.diagnostics_var.get():
+                self.show_diagnostics(self.profiler)
+            return
+        self.show_results(matches_df, store)
+    
+    def show_results(self, matches_df, store):
+        # Only one page of matches is held in the table at a time; the rest stay in the on-disk store
+        results_window = tk.Toplevel(self)
+        results_window.title(f"MaRMAT Results ({len(matches_df):,} matches)")
+        results_window.columnconfigure(0, weight=1)
+        results_window.rowconfigure(1, weight=1)
+        view = {'filters': {'Category': '', 'Column': '', 'Term': ''}, 'sort': None, 'descending': False, 'page': 0, 'count': len(matches_df)}
+        
+        filter_frame = ttk.Frame(results_window)
+        filter_frame.grid(row=0, column=0, columnspan=2, padx=10, pady=5, sticky="w")
+        filter_vars = {}
+        for position, column in enumerate(('Category', 'Column', 'Term')):
+            ttk.Label(filter_frame, text=f"{column}:").grid(row=0, column=position * 2, padx=(10, 2), sticky="w")
+            filter_vars[column] = tk.StringVar()
+            if column == 'Term':
+                ttk.Entry(filter_frame, textvariable=filter_vars[column], width=25).grid(row=0, column=position * 2 + 1, sticky="w")
+            else:
+                ttk.Combobox(filter_frame, textvariable=filter_vars[column], state='readonly', width=25,
+                             values=[''] + [str(value) for value in store.distinct(column)]).grid(row=0, column=position * 2 + 1, sticky="w")
+        
+        results_table = ttk.Treeview(results_window, columns=store.columns, show='headings', height=25)
+        results_table.grid(row=1, column=0, padx=(10, 0), pady=5, sticky="nsew")
+        table_scrollbar = ttk.Scrollbar(results_window, orient="vertical", command=results_table.yview)
+        table_scrollbar.grid(row=1, column=1, padx=(0, 10), pady=5, sticky="ns")
+        results_table.configure(yscrollcommand=table_scrollbar.set)
+        
+        navigation_frame = ttk.Frame(results_window)
+        navigation_frame.grid(row=2, column=0, columnspan=2, padx=10, pady=5, sticky="ew")
+        page_label = ttk.Label(navigation_frame, text="")
+        
+        def show_page():
+            page_count = max(1, -(-view['count'] // RESULTS_PAGE_SIZE))
+            view['page'] = min(max(view['page'], 0), page_count - 1)
+            results_table.delete(*results_table.get_children())
+            for row in store.page(view['filters'], view['sort'], view['descending'], view['page'] * RESULTS_PAGE_SIZE):
+                results_table.insert('', tk.END, values=['' if value is None else value for value in row])
+            page_label.config(text=f"Page {view['page'] + 1:,} of {page_count:,} ({view['count']:,} matches)")
+        
+        def apply_filters():
+            view['filters'] = {column: variable.get() for column, variable in filter_vars.items()}
+            view['count'] = store.count(view['filters'])
+            view['page'] = 0
+            show_page()
+        
+        def clear_filters():
+            for variable in filter_vars.values():
+                variable.set('')
+            apply_filters()
+        
+        def sort_by(column):
+            view['descending'] = not view['descending'] if view['sort'] == column else False
+            view['sort'] = column
+            view['page'] = 0
+            for heading in store.columns:
+                arrow = (' \u25bc' if view['descending'] else ' \u25b2') if heading == column else ''
+                results_table.heading(heading, text=heading + arrow)
+            show_page()
+        
+        def go_to_page(page):
+            view['page'] = page
+            show_page()
+        
+        for column in store.columns:
+            is_text = column in ('Original Text', 'Context')
+            results_table.heading(column, text=column, command=lambda column=column: sort_by(column))
+            results_table.column(column, width=400 if is_text else 60 if column in ('Start', 'End', 'Count') else 120, stretch=is_text)
+        ttk.Button(filter_frame, text="Filter", command=apply_filters).grid(row=0, column=6, padx=(10, 2))
+        ttk.Button(filter_frame, text="Clear", command=clear_filters).grid(row=0, column=7, padx=2)
+        ttk.Button(navigation_frame, text="<< First", command=lambda: go_to_page(0)).grid(row=0, column=0, padx=2)
+        ttk.Button(navigation_frame, text="< Previous", command=lambda: go_to_page(view['page'] - 1)).grid(row=0, column=1, padx=2)
+        page_label.grid(row=0, column=2, padx=10)
+        ttk.Button(navigation_frame, text="Next >", command=lambda: go_to_page(view['page'] + 1)).grid(row=0, column=3, padx=2)
+        ttk.Button(navigation_frame, text="Last >>", command=lambda: go_to_page(view['count'])).grid(row=0, column=4, padx=2)
+        ttk.Button(navigation_frame, text="Export", command=lambda: self.export_results(matches_df)).grid(row=0, column=5, padx=(20, 2))
+        
+        def close_results():
+            store.close()
+            results_window.destroy()
+        
+        results_window.protocol("WM_DELETE_WINDOW", close_results)
+        show_page()
+    
+    def export_results(self, matches_df):
+        # Parquet and Arrow IPC files keep Term, Category and Column dictionary-encoded; both need pyarrow
+        output_file_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv"), ("Parquet files", "*.parquet"), ("Arrow IPC files", "*.arrow")])
         if output_file_path:
             try:
-                matches_df = pd.DataFrame(matches_filtered, columns=['Identifier', 'Term', 'Category', 'Column', 'Original Text'])
-                matches_df.to_csv(output_file_path, index=False)
+                with self.profiler.stage('write results'):
+                    extension = os.path.splitext(output_file_path)[1].lower()
+                    if extension == '.parquet':
+                        matches_df.to_parquet(output_file_path, index=False)
+                    elif extension in ('.arrow', '.feather'):
+                        matches_df.reset_index(drop=True).to_feather(output_file_path)
+                    else:
+                        matches_df.to_csv(output_file_path, index=False)
                 messagebox.showinfo("Success", f"Merged data saved to: {output_file_path}")
+                if self.diagnostics_var.get():
+                    self.show_diagnostics(self.profiler)
                 self.reset()
             except Exception as e:
                 messagebox.showerror("Error", f"An error occurred while saving file: {e}")
     
+    def show_diagnostics(self, profiler):
+        report = profiler.report()
+        diagnostics_window = tk.Toplevel(self)
+        diagnostics_window.title("MaRMAT Diagnostics")
+        
+        diagnostics_text = tk.Text(diagnostics_window, width=100, height=35, wrap='none', font=('Courier', 9))
+        diagnostics_text.grid(row=0, column=0, padx=10, pady=10, sticky="nsew")
+        diagnostics_text.insert(tk.END, profiler.format_text(report))
+        diagnostics_text.config(state='disabled')
+        
+        def save_report():
+            report_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON files", "*.json")])
+            if report_path:
+                try:
+                    with open(report_path, 'w', encoding='utf-8') as report_file:
+                        json.dump(report, report_file, indent=2)
+                except Exception as e:
+                    messagebox.showerror("Error", f"An error occurred while saving the report: {e}")
+        
+        save_button = ttk.Button(diagnostics_window, text="Save Report", command=save_report)
+        save_button.grid(row=1, column=0, padx=10, pady=10, sticky="e")
+    
     def toggle_columns(self):
         if self.all_columns_var.get():
             self.column_listbox.selection_set(0, tk.END)
@@ -206,20 +635,97 @@ class MaRMAT(tk.Tk):
     
     def get_selected_categories(self):
         return [self.categories[i] for i in self.category_listbox.curselection()]
+    
+    def get_selected_workers(self):
+        try:
+            return max(1, int(self.workers_var.get()))
+        except (tk.TclError, ValueError):
+            return 1
+    
+    def get_selected_context(self):
+        # Number of context characters around each match, or None to keep the full text of the cell
+        if not self.context_var.get():
+            return None
+        try:
+            return max(0, int(self.context_chars_var.get()))
+        except (tk.TclError, ValueError):
+            return DEFAULT_CONTEXT_CHARS
 
-    def find_matches(self, selected_columns, selected_categories):
-        matches = []
-        lexicon_df = self.lexicon_df[self.lexicon_df['category'].isin(selected_categories)]
+    def find_matches(self, selected_columns, selected_categories, workers=None, progress=None, cancel_event=None, context=None, count_occurrences=False, variants=False, fold_accents=False):
+        # Matches blocks of rows in order, reporting progress after each block and stopping early when
+        # cancel_event is set; the matches of the blocks finished so far are returned. Each match carries the
+        # start and end offsets of the term in its cell, and with a number of context characters, a snippet
+        # around the term replaces the full text of the cell. With count_occurrences, a Count column gives
+        # the number of times the term occurs in the cell, counted during the same scan. With variants, the
+        # singular and plural forms of the terms are compiled into the matcher and reported as their terms.
+        # Terms and cells are matched after NFKC normalization and case folding, and with fold_accents,
+        # without their accents; offsets always refer to the original text
+        profiler = self.profiler
+        with profiler.stage('compile lexicon'):
+            lexicon_df = self.lexicon_df[self.lexicon_df['category'].isin(selected_categories)]
+            terms = lexicon_df['term'].tolist()
+            categories = lexicon_df['category'].tolist()
+            matcher = LexiconMatcher(terms, variants, fold_accents)  # Compile the selected lexicon once for the whole run
 
-        for index, row in self.metadata_df.iterrows():
-            for col in selected_columns:
-                if isinstance(row[col], str):
-                    for term, category in zip(lexicon_df['term'], lexicon_df['category']):
-                        # Check for multiple matches of terms within a single metadata cell
-                        if re.search(r'\b' + re.escape(term.lower()) + r'\b', row[col].lower()):
-                            matches.append((row[self.identifier_column], term, category, col, row[col]))
+        # Work column by column instead of building a Series for every row
+        frame = self.metadata_df[list(dict.fromkeys(selected_columns))]
+        if workers is None:
+            workers = self.get_selected_workers()
+        total_rows = len(frame)
+        block_rows = max(1, min(MATCH_BLOCK_ROWS, -(-total_rows // (workers * 4))))
+        bounds = list(range(0, total_rows, block_rows)) + [total_rows]
+        blocks = list(zip(bounds[:-1], bounds[1:]))
+        results = [_no_matches()]
+        with profiler.stage('match'):
+            if workers <= 1 or len(blocks) <= 1:
+                for start, stop in blocks:
+                    if cancel_event is not None and cancel_event.is_set():
+                        break
+                    results.append(_match_frame(frame.iloc[start:stop], selected_columns, matcher, start, profiler, context))
+                    if progress:
+                        progress(stop, total_rows)
+            else:
+                # Share contiguous blocks of rows across a process pool; the matcher is shipped once per worker
+                with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(_match_frame, matcher)) as pool:
+                    futures = [pool.submit(match_shard, frame.iloc[start:stop], selected_columns, start, {'context': context}) for start, stop in blocks]
+                    for future, (start, stop) in zip(futures, blocks):
+                        if cancel_event is not None and cancel_event.is_set():
+                            for pending in futures:
+                                pending.cancel()
+                            break
+                        results.append(future.result())
+                        if progress:
+                            progress(stop, total_rows)
+            rows, cols, term_ids, starts, ends, occurrences, snippets = (np.concatenate(parts) for parts in zip(*results))
+        profiler.count_matches(terms, categories, term_ids)
 
-        return matches
+        # Assemble the match table in bulk, ordered by row, then column, then lexicon order. Term, Category
+        # and Column are dictionary-encoded, and Original Text refers to the metadata cells instead of copying them
+        with profiler.stage('assemble matches'):
+            order = np.lexsort((term_ids, cols, rows))
+            rows, cols, term_ids = rows[order], cols[order], term_ids[order]
+            if context is not None:
+                text_column, texts = 'Context', snippets[order]
+            else:
+                text_column, texts = 'Original Text', np.empty(len(rows), dtype=object)
+                for col_position, col in enumerate(selected_columns):
+                    in_column = cols == col_position
+                    texts[in_column] = self.metadata_df[col].to_numpy(dtype=object)[rows[in_column]]
+            term_codes, term_names = dictionary_codes(terms)
+            category_codes, category_names = dictionary_codes(categories)
+            col_codes, col_names = dictionary_codes(selected_columns)
+            matches_df = pd.DataFrame({
+                'Identifier': self.metadata_df[self.identifier_column].to_numpy()[rows],
+                'Term': pd.Categorical.from_codes(term_codes[term_ids], categories=term_names),
+                'Category': pd.Categorical.from_codes(category_codes[term_ids], categories=category_names),
+                'Column': pd.Categorical.from_codes(col_codes[cols], categories=col_names),
+                'Start': starts[order],
+                'End': ends[order],
+            })
+            if count_occurrences:
+                matches_df['Count'] = occurrences[order]
+            matches_df[text_column] = texts
+            return matches_df
     
     def back_to_main_frame(self):
         self.column_selection_frame.grid_remove()
@@ -238,13 +744,16 @@ class MaRMAT(tk.Tk):
         self.load_metadata_button.config(state='normal')
         self.lexicon_df = None
         self.metadata_df = None
+        self.metadata_path = None
         self.columns = []
         self.categories = []
         self.selected_columns = []
         self.identifier_column = None
+        self.profiler = Profiler()
         self.next_button.grid_remove()
         self.explanation_label.grid()
 
-# Create and run the application
-app = MaRMAT()
-app.mainloop()
+# Create and run the application (guarded so worker processes can import this script safely)
+if __name__ == "__main__":
+    app = MaRMAT()
+    app.mainloop()
@@ -1,5 +1,818 @@
-import pandas as pd
+import argparse
+import copy
+import glob
+import hashlib
+import io
+import itertools
+import json
+import os
+import pickle
+import queue
 import re
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+from contextlib import nullcontext, redirect_stdout
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from marmat_engine import (LexiconMatcher, Profiler, detect_encoding, dictionary_codes, init_worker, iter_oai_page,
+                           iter_oai_records, lazy_import, lexicon_keys, match_columns, match_shard, metadata_dtypes,
+                           normalize_text, read_csv, read_header, term_variants, word_pattern)
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+MATCH_COLUMNS = ['Identifier', 'Term', 'Category', 'Column']  # Columns of the matching results
+OAI_RETRY_STATUSES = {429, 500, 502, 503, 504}  # HTTP statuses of OAI-PMH requests worth retrying
+OUTPUT_EXTENSIONS = {'csv': '.csv', 'parquet': '.parquet', 'arrow': '.arrow'}  # Output formats and their file extensions
+SUMMARY_EXTENSIONS = {'csv': '.csv', 'json': '.json'}  # Summary formats and their file extensions
+SUMMARY_CHUNK_ROWS = 100000  # Rows per chunk when only a summary is saved and no chunk size is selected
+LEXICON_CACHE_VERSION = 5  # Bump whenever the layout of CompiledLexicon changes
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024  # Default size limit of the compiled lexicon cache
+
+
+def _heading_chain(heading, fold_accents=False):
+    """Split an LCSH heading into its normalized heading and subdivision components.
+
+    Parameters:
+    heading (str): A heading such as 'Afghanistan--Politics and government--2001-'.
+    fold_accents (bool): True to remove accents from the components; see normalize_text.
+
+    Returns:
+    list of str: Components normalized by normalize_text, with surrounding whitespace and trailing periods removed.
+
+    """
+    chain = [normalize_text(' '.join(component.split()).rstrip('.'), fold_accents) for component in heading.split('--')]
+    return [component for component in chain if component]
+
+
+class HeadingTrie:
+    """A prefix trie of LCSH headings, keyed by heading and subdivision components.
+
+    Subject cells are split on ';' into headings and each heading on '--' into a chain of components,
+    so each subject is looked up in time proportional to its own length, whatever the lexicon size.
+
+    """
+
+    def __init__(self, terms, match='broader', fold_accents=False):
+        """Build the trie from lexicon headings.
+
+        Parameters:
+        terms (list of str): Lexicon headings, in lexicon order. Terms that are not strings are ignored.
+        match (str): 'exact' to report a lexicon heading only when a subject is the same heading,
+            'broader' to also report it when a subject is a narrower heading under it
+            (e.g. 'Indians of North America' for 'Indians of North America--Monuments'), or
+            'heading' to report it whenever a subject has the same main heading, ignoring subdivisions.
+            'heading' is a broad, recall-oriented mode: every lexicon heading under a main heading is
+            reported for any subject under it, e.g. 'World War, 1939-1945--Gays' for
+            'World War, 1939-1945--Campaigns--France'.
+        fold_accents (bool): True to match headings with their accents removed.
+
+        """
+        if match not in ('exact', 'broader', 'heading'):
+            raise ValueError(f"Unknown LCSH match mode: {match}")
+        self.terms = list(terms)
+        self.match = match
+        self.fold_accents = fold_accents
+        self._children = [{}]  # Child nodes of each node, keyed by component
+        self._terms = [[]]  # Indexes of the lexicon headings that end at each node
+        self._heading_terms = [[]]  # Indexes of the lexicon headings whose main heading is each node
+
+        for index, term in enumerate(self.terms):
+            if not isinstance(term, str):
+                continue
+            chain = _heading_chain(term, fold_accents)
+            if not chain:
+                continue
+            node = 0
+            for depth, component in enumerate(chain):
+                child = self._children[node].get(component)
+                if child is None:
+                    child = len(self._children)
+                    self._children.append({})
+                    self._terms.append([])
+                    self._heading_terms.append([])
+                    self._children[node][component] = child
+                node = child
+                if depth == 0:
+                    self._heading_terms[node].append(index)
+            self._terms[node].append(index)
+
+    def find_heading(self, heading):
+        """Find the lexicon headings that match one subject heading.
+
+        Parameters:
+        heading (str): A subject heading with its subdivisions.
+
+        Returns:
+        list of int: Indexes of the matched lexicon headings, in no particular order.
+
+        """
+        chain = _heading_chain(heading, self.fold_accents)
+        found = []
+        node = 0
+        for depth, component in enumerate(chain):
+            node = self._children[node].get(component)
+            if node is None:
+                break
+            if depth == 0 and self.match == 'heading':
+                return list(self._heading_terms[node])
+            if self.match == 'broader' or depth == len(chain) - 1:
+                found.extend(self._terms[node])
+        return found
+
+    def find_terms(self, text):
+        """Find the lexicon headings that match any subject heading in a cell.
+
+        Parameters:
+        text (str): Cell with subject headings separated by semicolons.
+
+        Returns:
+        list of int: Indexes of the matched lexicon headings, in lexicon order, each reported once.
+
+        """
+        found = set()
+        for heading in text.split(';'):
+            found.update(self.find_heading(heading))
+        return sorted(found)
+
+    def count_terms(self, text):
+        """Count the subject headings of a cell that match each lexicon heading.
+
+        Returns:
+        list of tuple: (term index, number of matching subject headings) of the matched lexicon headings,
+        in lexicon order.
+
+        """
+        counts = {}
+        for heading in text.split(';'):
+            for index in set(self.find_heading(heading)):
+                counts[index] = counts.get(index, 0) + 1
+        return sorted(counts.items())
+
+
+class CompiledLexicon:
+    """The selected lexicon terms and categories, compiled once for a matching engine.
+
+    A compiled lexicon can be pickled, so it is shipped once to each worker process in a parallel run.
+
+    """
+
+    def __init__(self, terms, categories, engine='automaton', lcsh_match='broader', variants=False, fold_accents=False):
+        """Compile the selected lexicon.
+
+        Parameters:
+        terms (list of str): Lexicon terms, in lexicon order.
+        categories (list of str): Category of each term.
+        engine (str): 'automaton', 'vectorized', 'lcsh' or 'regex'.
+        lcsh_match (str): How the 'lcsh' engine matches headings; see HeadingTrie.
+        variants (bool): True to also match the singular and plural forms of each term, reported as the
+            term itself. Not used by the 'lcsh' engine, which matches headings as they are.
+        fold_accents (bool): True to match terms and metadata with their accents removed; see normalize_text.
+
+        """
+        self.terms = list(terms)
+        self.categories = list(categories)
+        self.engine = engine
+        self.fold_accents = fold_accents
+        if engine == 'automaton':
+            self.matcher = LexiconMatcher(self.terms, variants, fold_accents)
+        elif engine == 'lcsh':
+            self.matcher = HeadingTrie(self.terms, lcsh_match, fold_accents)
+        elif engine == 'vectorized':
+            self.patterns = [(term_index, word_pattern(keys))
+                             for term_index, keys in enumerate(lexicon_keys(self.terms, variants, fold_accents)) if keys]
+            self.combined = '|'.join(pattern for term_index, pattern in self.patterns)
+        elif engine == 'regex':
+            # Compiled here rather than left to the re module cache, which only holds 512 patterns
+            self.term_patterns = [re.compile(word_pattern(keys)) if keys else None
+                                  for keys in lexicon_keys(self.terms, variants, fold_accents)]
+
+    def match_column(self, values, profiler=None, counts=False):
+        """Match the string cells of one metadata column against the lexicon.
+
+        The automaton engine scans each cell once and the lcsh engine looks up each subject heading
+        of a cell in the heading trie. The vectorized engine normalizes the column once,
+        uses a combined pattern of all terms to discard cells without any match, then tests each term
+        pattern against the remaining cells in one batched call.
+
+        Parameters:
+        values (pandas.Series): String cells of the column, with object dtype so that string
+            operations use Python's re module.
+        profiler (Profiler): Records the time spent on each term by the vectorized engine, if given.
+        counts (bool): True to count the occurrences of each matched term in its cell, during the same
+            scan (the lcsh engine counts matching subject headings); otherwise every count is 1.
+
+        Returns:
+        tuple of numpy.ndarray: Positions within values, lexicon term indexes and occurrence counts of the matches.
+
+        """
+        if self.engine in ('automaton', 'lcsh'):
+            positions, term_ids, occurrences = [], [], []
+            for position, text in enumerate(values.tolist()):
+                found = self.matcher.count_terms(text) if counts else [(term_index, 1) for term_index in self.matcher.find_terms(text)]
+                for term_index, count in found:
+                    positions.append(position)
+                    term_ids.append(term_index)
+                    occurrences.append(count)
+            return (np.asarray(positions, dtype=np.int64), np.asarray(term_ids, dtype=np.int64),
+                    np.asarray(occurrences, dtype=np.int64))
+
+        positions, term_ids, occurrences = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+        if self.patterns:
+            with profiler.stage('normalize') if profiler else nullcontext():
+                lowered = pd.Series([normalize_text(text, self.fold_accents) for text in values.tolist()],
+                                    index=values.index, dtype=object)
+            with profiler.stage('prefilter') if profiler else nullcontext():
+                candidates = np.flatnonzero(lowered.str.contains(self.combined, regex=True).to_numpy(dtype=bool))
+            lowered = lowered.iloc[candidates]
+            for term_index, pattern in self.patterns:
+                start = time.perf_counter()
+                if counts:
+                    found = lowered.str.count(pattern).to_numpy(dtype=np.int64)
+                    hits, hit_counts = candidates[found > 0], found[found > 0]
+                else:
+                    hits = candidates[lowered.str.contains(pattern, regex=True).to_numpy(dtype=bool)]
+                    hit_counts = np.ones(len(hits), dtype=np.int64)
+                if profiler:
+                    profiler.add(profiler.terms, (self.terms[term_index], self.categories[term_index]), time.perf_counter() - start)
+                positions.append(hits)
+                term_ids.append(np.full(len(hits), term_index, dtype=np.int64))
+                occurrences.append(hit_counts)
+        return np.concatenate(positions), np.concatenate(term_ids), np.concatenate(occurrences)
+
+
+def _match_frame(frame, selected_columns, compiled, offset=0, profiler=None, counts=False):
+    """Match the selected columns of a metadata frame column by column.
+
+    Metadata is repetitive, so each distinct cell value of a column is matched only once.
+
+    Parameters:
+    frame (pandas.DataFrame): Metadata rows to match.
+    selected_columns (list of str): Columns to match, in output order.
+    compiled (CompiledLexicon): Compiled lexicon.
+    offset (int): Position of the first row of the frame within the full metadata.
+    profiler (Profiler): Records the time spent on each column, if given.
+    counts (bool): True to count the occurrences of each matched term (see CompiledLexicon.match_column).
+
+    Returns:
+    tuple of numpy.ndarray: Row positions, selected column positions, term indexes and occurrence counts of the matches.
+
+    """
+    def match_values(uniques):
+        return compiled.match_column(pd.Series(uniques, dtype=object), profiler, counts)
+
+    return match_columns(frame, selected_columns, match_values, offset, profiler)
+
+
+def _match_table(identifiers, term_ids, cols, selected_columns, compiled, occurrences=None):
+    """Build a compact match table from parallel arrays of identifiers, term indexes and column positions.
+
+    Term, Category and Column are stored as categoricals: an integer code per match plus a dictionary of
+    the distinct terms, categories and column names, instead of one string object per match. If occurrence
+    counts are given, they are added as a Count column.
+
+    """
+    term_ids = np.asarray(term_ids, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    term_codes, terms = dictionary_codes(compiled.terms)
+    category_codes, categories = dictionary_codes(compiled.categories)
+    col_codes, columns = dictionary_codes(selected_columns)
+    matches_df = pd.DataFrame({
+        'Identifier': identifiers,
+        'Term': pd.Categorical.from_codes(term_codes[term_ids], categories=terms),
+        'Category': pd.Categorical.from_codes(category_codes[term_ids], categories=categories),
+        'Column': pd.Categorical.from_codes(col_codes[cols], categories=columns),
+    })
+    if occurrences is not None:
+        matches_df['Count'] = np.asarray(occurrences, dtype=np.int64)
+    return matches_df
+
+
+class MatchWriter:
+    """Writes match tables to a CSV, Parquet or Arrow IPC file, in one go or chunk by chunk.
+
+    Parquet and Arrow output require the optional pyarrow package. Every chunk is written with the same
+    schema: Identifier as strings, as in CSV output, whatever type the identifiers of a chunk were read as;
+    Term, Category and Column dictionary-encoded, which keeps the files small and fast to load; and Count
+    as integers. If writing fails, the incomplete file is removed.
+    """
+
+    def __init__(self, path, output_format='csv', columns=MATCH_COLUMNS):
+        """Create the output file; for CSV, the header is written immediately."""
+        if output_format not in OUTPUT_EXTENSIONS:
+            raise ValueError(f"Unknown output format: {output_format}")
+        self.path = path
+        self.output_format = output_format
+        self.columns = list(columns)
+        self.writer = None
+        if output_format == 'csv':
+            self.file = open(path, 'w', newline='', encoding='utf-8')
+            pd.DataFrame(columns=self.columns).to_csv(self.file, index=False)
+        else:
+            try:
+                import pyarrow  # Only needed for Parquet and Arrow output
+            except ImportError:
+                raise ImportError(f"Writing {output_format} output requires the pyarrow package (pip install pyarrow)")
+            self.pyarrow = pyarrow
+            self.schema = pyarrow.schema([(column, pyarrow.int64() if column == 'Count' else pyarrow.string() if column == 'Identifier'
+                                           else pyarrow.dictionary(pyarrow.int32(), pyarrow.string())) for column in self.columns])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.close()
+        finally:
+            if exc_type is not None and os.path.exists(self.path):
+                os.remove(self.path)  # Do not leave a truncated output behind
+
+    def write(self, matches_df):
+        """Append a table of matches to the output file."""
+        if self.output_format == 'csv':
+            matches_df.to_csv(self.file, header=False, index=False)
+            return
+        identifiers = matches_df['Identifier']
+        matches_df = matches_df.assign(Identifier=identifiers.astype(object).where(identifiers.isna(), identifiers.astype(str)))
+        table = self.pyarrow.Table.from_pandas(matches_df[self.columns], schema=self.schema, preserve_index=False)
+        if self.writer is None:
+            if self.output_format == 'parquet':
+                import pyarrow.parquet
+                self.writer = pyarrow.parquet.ParquetWriter(self.path, self.schema)
+            else:
+                import pyarrow.ipc
+                self.writer = pyarrow.ipc.new_file(self.path, self.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        """Finish the output file."""
+        if self.output_format == 'csv':
+            self.file.close()
+            return
+        if self.writer is None:
+            self.write(pd.DataFrame({column: pd.Series(dtype=object) for column in self.columns}))
+        self.writer.close()
+
+
+class MatchSummary:
+    """Aggregate counts of matches, updated table by table as matches stream out of the matcher.
+
+    Matches and affected records are counted in total and per category, column and lexicon term, so the
+    memory used grows with the size of the lexicon and the number of columns, not with the number of
+    matches. A record counts as affected once per table it has matches in; since every metadata row is
+    matched in exactly one chunk, affected records are counted exactly when identifiers are unique.
+    """
+
+    LEVELS = (('category', ['Category']), ('column', ['Column']), ('term', ['Term', 'Category']))
+
+    def __init__(self, count_occurrences=False):
+        """Start with empty counts; with count_occurrences, the Count column of the matches is summed too."""
+        self.count_occurrences = count_occurrences
+        self.records_scanned = 0
+        self.total = [0, 0, 0]  # Matches, affected records and occurrences
+        self.counts = {level: {} for level, keys in self.LEVELS}  # Same counts for each key of each level
+
+    def add(self, matches_df, row_count):
+        """Add the matches found in a table of metadata rows to the counts.
+
+        Parameters:
+        matches_df (pandas.DataFrame): Matches found in the rows, with a Count column if occurrences are counted.
+        row_count (int): Number of metadata rows searched.
+
+        """
+        self.records_scanned += row_count
+        if not len(matches_df):
+            return
+        # Identifiers are compared as written to the output, so those carried over from a previous output as
+        # strings count as the same records as freshly matched ones
+        frame = matches_df.assign(Identifier=matches_df['Identifier'].astype(str),
+                                  Occurrences=pd.to_numeric(matches_df['Count']) if self.count_occurrences else 1)
+        for position, value in enumerate((len(frame), frame['Identifier'].nunique(), frame['Occurrences'].sum())):
+            self.total[position] += int(value)
+        for level, keys in self.LEVELS:
+            grouped = frame.groupby(keys, observed=True, sort=False).agg(
+                matches=('Identifier', 'size'), records=('Identifier', 'nunique'), occurrences=('Occurrences', 'sum'))
+            counts = self.counts[level]
+            for key, matches, records, occurrences in zip(grouped.index, grouped['matches'], grouped['records'], grouped['occurrences']):
+                key = key if isinstance(key, tuple) else (key,)
+                totals = counts.setdefault(key, [0, 0, 0])
+                totals[0] += int(matches)
+                totals[1] += int(records)
+                totals[2] += int(occurrences)
+
+    def table(self):
+        """Return the summary as a table with a row for all matches, then one per category, column and term.
+
+        Returns:
+        pandas.DataFrame: Level, Term, Category, Column, Matches, Records (affected records), Percent (of the
+        records searched) and, when occurrences are counted, Occurrences. Rows of a level are ordered by
+        decreasing number of matches.
+
+        """
+        rows = [['all', None, None, None] + self.total]
+        for level, keys in self.LEVELS:
+            for key, totals in sorted(self.counts[level].items(), key=lambda item: (-item[1][0], [str(part) for part in item[0]])):
+                named = dict(zip(keys, key))
+                rows.append([level, named.get('Term'), named.get('Category'), named.get('Column')] + totals)
+        table = pd.DataFrame(rows, columns=['Level', 'Term', 'Category', 'Column', 'Matches', 'Records', 'Occurrences'])
+        percent = (100 * table['Records'] / self.records_scanned).round(2) if self.records_scanned else 0.0
+        table.insert(6, 'Percent', percent)
+        return table if self.count_occurrences else table.drop(columns='Occurrences')
+
+    def write(self, path, summary_format='csv'):
+        """Save the summary as a CSV table (see table) or as a JSON report.
+
+        Parameters:
+        path (str): Path of the summary file.
+        summary_format (str): 'csv' or 'json'.
+
+        """
+        table = self.table()
+        if summary_format == 'csv':
+            table.to_csv(path, index=False, encoding='utf-8')
+            return
+        report = {'records_scanned': self.records_scanned, 'records_matched': self.total[1], 'matches': self.total[0]}
+        if self.count_occurrences:
+            report['occurrences'] = self.total[2]
+        for level, keys in self.LEVELS:
+            entries = table[table['Level'] == level].drop(columns=['Level'] + [column for column in ('Term', 'Category', 'Column') if column not in keys])
+            report[{'category': 'categories', 'column': 'columns', 'term': 'terms'}[level]] = entries.to_dict('records')
+        with open(path, 'w', encoding='utf-8') as summary_file:
+            json.dump(report, summary_file, indent=2, ensure_ascii=False)
+
+
+def read_matches(path, output_format='csv', columns=None):
+    """Read an output file of matches written in any output format.
+
+    CSV output is read as strings, exactly as written, except for the Count column, which is read as integers
+    as in the other formats. Term, Category and Column of Parquet and Arrow output are returned as plain
+    strings instead of categoricals.
+
+    Parameters:
+    path (str): Path to the output file.
+    output_format (str): 'csv', 'parquet' or 'arrow'.
+    columns (list of str): Columns to read, or None to read all columns.
+
+    Returns:
+    pandas.DataFrame: The matches.
+
+    """
+    if output_format == 'csv':
+        matches_df = pd.read_csv(path, dtype=str, keep_default_na=False, encoding='utf-8', usecols=columns)
+        if 'Count' in matches_df.columns:
+            matches_df['Count'] = matches_df['Count'].astype('int64')
+        return matches_df
+    if output_format == 'parquet':
+        matches_df = pd.read_parquet(path, columns=columns)
+    else:
+        matches_df = pd.read_feather(path, columns=columns)  # Feather version 2 is the Arrow IPC file format
+    return matches_df.astype({column: object for column in ('Term', 'Category', 'Column') if column in matches_df.columns})
+
+
+class LexiconCache:
+    """An on-disk cache of compiled lexicons.
+
+    Entries are keyed by the content hash of the lexicon file, the selected categories and the compile
+    options, so a cached lexicon is reused only for exactly the same input. When the cache grows beyond
+    its size limit, the least recently used entries are evicted.
+
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_CACHE_BYTES):
+        """Open the cache, creating its directory if needed.
+
+        Parameters:
+        directory (str): Directory holding the cache entries.
+        max_bytes (int): Maximum total size of the cache entries, in bytes.
+
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, lexicon_hash, selected_categories, options):
+        """Build the cache key of a compiled lexicon.
+
+        Parameters:
+        lexicon_hash (str): SHA-256 hash of the lexicon file content.
+        selected_categories (list of str): Categories selected for matching.
+        options (dict): Options the lexicon is compiled with, such as the matching engine.
+
+        Returns:
+        str: The cache key.
+
+        """
+        material = json.dumps([LEXICON_CACHE_VERSION, lexicon_hash, sorted(set(selected_categories)), options], sort_keys=True)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the cached compiled lexicon for a key, or None if it is missing or unreadable."""
+        path = os.path.join(self.directory, key + '.pickle')
+        try:
+            with open(path, 'rb') as cache_file:
+                compiled = pickle.load(cache_file)
+            os.utime(path)  # Mark the entry as recently used
+            return compiled
+        except Exception:
+            return None
+
+    def put(self, key, compiled):
+        """Store a compiled lexicon under a key, then evict old entries beyond the size limit."""
+        path = os.path.join(self.directory, key + '.pickle')
+        try:
+            descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(descriptor, 'wb') as cache_file:
+                pickle.dump(compiled, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_path, path)  # Readers never see a partly written entry
+        except Exception as e:
+            print(f"An error occurred while caching the compiled lexicon: {e}")
+            return
+        self._evict()
+
+    def _evict(self):
+        """Remove the least recently used entries until the cache fits its size limit."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pickle'):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for mtime, size, name in entries)
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+                total -= size
+            except OSError:
+                pass
+
+
+def oai_fields(source):
+    """List the fields found in the records of an OAI-PMH document, in order of first appearance."""
+    fields = {}
+    for record in iter_oai_records(source):
+        fields.update(dict.fromkeys(record))
+    return list(fields)
+
+
+def _check_oai_fields(columns, fields):
+    """Raise the error pandas raises for a CSV file if some of the columns are not among the fields of the records.
+
+    Parameters:
+    columns (list of str): Requested fields.
+    fields (set of str): Fields found in the records; nothing is checked if no records were found.
+
+    """
+    missing = [col for col in columns if col not in fields]
+    if fields and missing:
+        raise ValueError(f"Usecols do not match columns, columns expected but not found: {missing}")
+
+
+def read_oai_frames(source, columns, chunk_size=None):
+    """Read the records of an OAI-PMH document into data frames of the given columns.
+
+    Parameters:
+    source (str or file object): Path to the XML file, or a binary file object.
+    columns (list of str): Fields to read; records without a field get a missing value.
+    chunk_size (int): Records per frame, or None to read every record into a single frame.
+
+    Yields:
+    pandas.DataFrame: Frames of records, at least one even if the document has no records.
+
+    Raises:
+    ValueError: If one of the columns is found in none of the records, once every record has been read.
+
+    """
+    rows, fields = [], set()
+    for record in iter_oai_records(source):
+        fields.update(record)
+        rows.append([record.get(col) for col in columns])
+        if chunk_size and len(rows) == chunk_size:
+            yield pd.DataFrame(rows, columns=columns)
+            rows = []
+    _check_oai_fields(columns, fields)
+    if rows or not chunk_size:
+        yield pd.DataFrame(rows, columns=columns)
+
+
+def _fetch_oai_page(base_url, params, retries=3, backoff=1.0, timeout=60):
+    """Request one page from an OAI-PMH endpoint, retrying connection errors and busy or failing servers.
+
+    Waits between attempts double from backoff seconds, unless the server asks for a delay with Retry-After.
+
+    """
+    url = base_url + ('&' if '?' in base_url else '?') + urllib.parse.urlencode(params)
+    for attempt in range(retries + 1):
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                return response.read()
+        except urllib.error.HTTPError as e:
+            if e.code not in OAI_RETRY_STATUSES or attempt == retries:
+                raise
+            retry_after = e.headers.get('Retry-After', '')
+            delay = float(retry_after) if retry_after.isdigit() else backoff * 2 ** attempt
+        except (urllib.error.URLError, OSError):
+            if attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt
+        time.sleep(delay)
+
+
+def harvest_oai_set(base_url, set_spec=None, metadata_prefix='qdc', retries=3):
+    """Harvest the records of one set with ListRecords, following resumptionTokens page by page.
+
+    Parameters:
+    base_url (str): Base URL of the OAI-PMH endpoint, e.g. https://collections.lib.utah.edu/oai.
+    set_spec (str): Set to harvest, or None for the whole repository.
+    metadata_prefix (str): Metadata format to request, e.g. 'qdc' or 'oai_dc'.
+    retries (int): Number of times a failed request is retried.
+
+    Yields:
+    list of dict: The records of each page, as returned by iter_oai_records.
+
+    """
+    params = {'verb': 'ListRecords', 'metadataPrefix': metadata_prefix}
+    if set_spec:
+        params['set'] = set_spec
+    seen_tokens = set()
+    while True:
+        page = iter_oai_page(io.BytesIO(_fetch_oai_page(base_url, params, retries)))
+        records = []
+        while True:
+            try:
+                records.append(next(page))
+            except StopIteration as end:
+                resumption_token, error = end.value
+                break
+        if error is not None and error[0] != 'noRecordsMatch':
+            raise ValueError(f"OAI-PMH error {error[0]} for set {set_spec}: {error[1]}")
+        yield records
+        if resumption_token is None:
+            return
+        if resumption_token in seen_tokens:
+            raise ValueError(f"OAI-PMH endpoint repeated resumptionToken {resumption_token} for set {set_spec}")
+        seen_tokens.add(resumption_token)
+        params = {'verb': 'ListRecords', 'resumptionToken': resumption_token}
+
+
+def start_oai_harvest(base_url, sets=None, metadata_prefix='qdc', jobs=4, retries=3):
+    """Harvest the first page of each set concurrently, so their fields are known before matching starts.
+
+    Parameters:
+    base_url (str): Base URL of the OAI-PMH endpoint.
+    sets (list of str): Sets to harvest, or None for the whole repository.
+    metadata_prefix (str): Metadata format to request.
+    jobs (int): Number of sets harvested at the same time.
+    retries (int): Number of times a failed request is retried.
+
+    Returns:
+    dict: For each set, its first page of records and the harvest_oai_set generator of its remaining
+        pages (see harvest_oai_pages).
+
+    """
+    def first_page(set_spec):
+        pages = harvest_oai_set(base_url, set_spec, metadata_prefix, retries)
+        return set_spec, (next(pages, []), pages)
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        return dict(pool.map(first_page, list(sets or [None])))
+
+
+def harvest_oai_pages(base_url, sets=None, metadata_prefix='qdc', jobs=4, retries=3, started=None):
+    """Harvest several sets concurrently, yielding pages of records as soon as they arrive.
+
+    At most jobs sets are harvested at the same time, and at most twice as many pages wait to be
+    consumed, so a slow consumer holds the harvest back instead of filling memory. Pages of one set
+    arrive in order; pages of different sets are interleaved.
+
+    Parameters:
+    base_url (str): Base URL of the OAI-PMH endpoint.
+    sets (list of str): Sets to harvest, or None for the whole repository.
+    metadata_prefix (str): Metadata format to request.
+    jobs (int): Number of sets harvested at the same time.
+    retries (int): Number of times a failed request is retried.
+    started (dict): Sets whose first page is already harvested, as returned by start_oai_harvest; each is
+        removed once its harvest resumes, so its pages are only yielded once.
+
+    Yields:
+    list of dict: The records of each page.
+
+    """
+    sets = list(sets or [None])
+    started = {} if started is None else started
+    pages = queue.Queue(maxsize=2 * max(1, jobs))
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def harvest(set_spec):
+        if stop.is_set():
+            return
+        try:
+            if set_spec in started:
+                first_page, rest = started.pop(set_spec)
+                set_pages = itertools.chain([first_page], rest)
+            else:
+                set_pages = harvest_oai_set(base_url, set_spec, metadata_prefix, retries)
+            for records in set_pages:
+                if not put(('page', records)):
+                    return
+            put(('done', set_spec))
+        except Exception as e:
+            put(('error', e))
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        for set_spec in sets:
+            pool.submit(harvest, set_spec)
+        try:
+            remaining = len(sets)
+            while remaining:
+                kind, value = pages.get()
+                if kind == 'page':
+                    yield value
+                elif kind == 'error':
+                    raise value
+                else:
+                    remaining -= 1
+        finally:
+            # Lets the running harvest threads finish if the consumer stops early or a set fails, and
+            # cancels the sets that have not started, so that no further requests are sent
+            stop.set()
+            pool.shutdown(cancel_futures=True)
+
+
+def _is_oai_harvest(path):
+    """Return True if a metadata path is the base URL of an OAI-PMH endpoint to harvest."""
+    return str(path).lower().startswith(('http://', 'https://'))
+
+
+def _is_oai_source(path):
+    """Return True if a metadata path is an OAI-PMH XML document rather than a CSV file."""
+    return str(path).lower().endswith('.xml')
+
+
+def _expand_metadata_paths(metadata_paths):
+    """Expand metadata files, directories and glob patterns into a sorted list of files without duplicates."""
+    files = []
+    for path in metadata_paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, '*.csv')) + glob.glob(os.path.join(path, '*.xml'))))
+        elif glob.has_magic(path):
+            files.extend(sorted(glob.glob(path)))
+        else:
+            files.append(path)
+    return list(dict.fromkeys(files))
+
+
+_batch_template = None  # Configured tool received by a batch job process when it starts
+
+
+def _init_batch_worker(template):
+    """Store the configured tool, including its compiled lexicon, shipped to a batch job process."""
+    global _batch_template
+    _batch_template = template
+
+
+def _match_batch_file(file_path, output_file):
+    """Match one metadata file of a batch and summarize the result."""
+    tool = copy.copy(_batch_template)
+    tool.metadata_df = None
+    tool.metadata_path = None
+    if tool.profiler is not None:
+        tool.profiler = Profiler()
+    tool.error = None
+    start = time.perf_counter()
+    match_count = None
+    try:
+        with redirect_stdout(io.StringIO()):  # Keep the messages of concurrent files from interleaving
+            if tool.load_metadata(file_path):
+                match_count = tool.perform_matching(output_file)
+    except Exception as e:
+        tool.error = f"An error occurred while matching {file_path}: {e}"
+    summary = {'File': file_path, 'Output': output_file, 'Status': 'ok', 'Matches': match_count or 0,
+               'Seconds': round(time.perf_counter() - start, 3)}
+    if match_count is None:
+        summary['Status'] = tool.error or 'failed'
+    elif tool.summary is not None:
+        for (category,), totals in tool.summary.counts['category'].items():
+            summary[category] = totals[0]
+    elif match_count:
+        for category, count in read_matches(output_file, tool.output_format, ['Category'])['Category'].value_counts().items():
+            summary[category] = int(count)
+    return summary
+
 
 class MaRMAT:
     """A tool for assessing metadata and identifying matches based on a provided lexicon."""
@@ -12,6 +825,31 @@ class MaRMAT:
         self.categories = []  # List of all available categories in the lexicon
         self.selected_columns = []  # List of columns selected for matching
         self.identifier_column = None  # Identifier column used to uniquely identify rows
+        self.engine = 'automaton'  # Matching engine: 'automaton', 'vectorized', 'lcsh' or 'regex' (see select_engine)
+        self.lcsh_match = 'broader'  # How the 'lcsh' engine matches headings (see select_lcsh_match)
+        self.variants = False  # Whether singular and plural forms of the lexicon terms are also matched
+        self.fold_accents = False  # Whether accents are removed from terms and metadata before matching
+        self.workers = 1  # Number of worker processes used for matching
+        self.chunk_size = None  # Rows per chunk in streaming mode, or None to load the whole metadata file
+        self.metadata_path = None  # Path of the metadata file, read chunk by chunk in streaming mode
+        self.metadata_encoding = 'utf-8'  # Encoding of the metadata CSV file, detected when it is loaded
+        self.lexicon_hash = None  # SHA-256 hash of the lexicon file content
+        self.lexicon_cache = None  # On-disk cache of compiled lexicons, if enabled
+        self.incremental = False  # Whether to re-assess only records changed since the previous run
+        self.lexicon_delta = False  # Whether to match only lexicon terms added since the previous run
+        self.profiler = None  # Records per-stage, per-column and per-term timing when profiling
+        self.output_format = 'csv'  # Format of the output file: 'csv', 'parquet' or 'arrow'
+        self.count_occurrences = False  # Whether to add the number of occurrences of each match as a Count column
+        self.summary_format = None  # Format of the summary of the matches ('csv' or 'json'), or None for no summary
+        self.summary_only = False  # Whether to save the summary instead of the matches
+        self.summary = None  # Summary of the last run, if a summary is selected
+        self.oai_sets = None  # Sets harvested when the metadata path is an OAI-PMH base URL, or None for all records
+        self.oai_prefix = 'qdc'  # Metadata format requested from an OAI-PMH endpoint
+        self.oai_jobs = 4  # Number of sets harvested at the same time
+        self.oai_retries = 3  # Number of times a failed OAI-PMH request is retried
+        self.oai_started = {}  # First pages harvested by load_metadata, by set, until matching resumes their harvest
+        self.compiled_lexicon = None  # Compiled lexicon reused across runs, e.g. for batch matching
+        self.error = None  # Message of the last error that stopped loading or matching (see _report_error)
 
     def load_lexicon(self, file_path):
         """Load the lexicon file.
@@ -21,23 +859,121 @@ class MaRMAT:
 
         """
         try:
-            self.lexicon_df = pd.read_csv(file_path, encoding='latin1')
+            with self._stage('load lexicon'):
+                with open(file_path, 'rb') as lexicon_file:
+                    content = lexicon_file.read()
+                self.lexicon_df = read_csv(io.BytesIO(content), detect_encoding(io.BytesIO(content)))[0]
+            self.lexicon_hash = hashlib.sha256(content).hexdigest()  # Identifies the lexicon in the cache
             print("Lexicon loaded successfully.")
         except Exception as e:
-            print(f"An error occurred while loading lexicon: {e}")
+            self._report_error(f"An error occurred while loading lexicon: {e}")
 
     def load_metadata(self, file_path):
         """Load the metadata file.
 
+        Only the header is read here, so the columns can be selected without parsing the whole file. The
+        rows of the selected and identifier columns are read when matching starts (see
+        load_selected_metadata), or chunk by chunk in streaming mode. The encoding of the file, UTF-8 or
+        Latin-1, is detected here from its first megabyte.
+
+        An OAI-PMH XML document (a ListRecords response or dump, ending in .xml) can be used instead of a
+        CSV file. Its records are streamed straight into matching, and its columns are the record fields
+        found in a first streaming pass, such as 'dc:title', 'dc:subject' or 'oai:identifier'.
+
+        The base URL of an OAI-PMH endpoint (http:// or https://) can also be used, to harvest the sets
+        selected with select_oai_harvest. Its columns are the fields found in the first page of records of
+        each set; those pages are kept for matching, and the remaining pages are matched as they arrive.
+
         Parameters:
-        file_path (str): Path to the metadata CSV file.
+        file_path (str): Path to the metadata CSV or OAI-PMH XML file, or base URL of an OAI-PMH endpoint.
+
+        Returns:
+        bool: True if the metadata is loaded.
 
         """
         try:
-            self.metadata_df = pd.read_csv(file_path, encoding='latin1')
-            print("Metadata loaded successfully.")
+            with self._stage('load metadata'):
+                self.oai_started = {}
+                if _is_oai_harvest(file_path):
+                    self.oai_started = start_oai_harvest(file_path, self.oai_sets, self.oai_prefix, self.oai_jobs,
+                                                         self.oai_retries)
+                    self.columns = list({field: None for first_page, _ in self.oai_started.values()
+                                         for record in first_page for field in record})
+                elif _is_oai_source(file_path):
+                    self.columns = oai_fields(file_path)
+                else:
+                    self.columns, self.metadata_encoding = read_header(file_path)
+            self.metadata_path = file_path
+            self.metadata_df = None
+            if _is_oai_source(file_path) or _is_oai_harvest(file_path):
+                print(f"Record fields found: {', '.join(self.columns)}")
+            if _is_oai_harvest(file_path):
+                print("Records will be harvested and matched page by page.")
+            elif self.chunk_size:
+                print("Metadata header loaded successfully; rows will be streamed during matching.")
+            else:
+                print("Metadata header loaded successfully; the selected columns will be read when matching.")
+            return True
         except Exception as e:
-            print(f"An error occurred while loading metadata: {e}")
+            self._report_error(f"An error occurred while loading metadata: {e}")
+            return False
+
+    def load_selected_metadata(self, columns=None):
+        """Read the rows of the selected and identifier columns of the metadata file.
+
+        Other columns are skipped while parsing. Text columns with few distinct values in a sample of
+        the file, such as creators or collection names, are read as categoricals. Columns that pandas
+        reads as numbers stay numeric, so the same cells are matched as when reading every column.
+
+        Parameters:
+        columns (list of str): Columns to read besides the identifier column, or None for the selected columns.
+
+        Returns:
+        bool: True if the metadata is loaded.
+
+        """
+        columns = list(dict.fromkeys(list(columns or self.selected_columns) + [self.identifier_column]))
+        if self.metadata_df is not None and all(col in self.metadata_df.columns for col in columns):
+            return True
+        if self.metadata_path is None:
+            self._report_error("Please load lexicon and metadata files first.")
+            return False
+        try:
+            with self._stage('load metadata'):
+                if _is_oai_harvest(self.metadata_path):
+                    self.metadata_df = pd.concat(list(self._harvest_frames(columns)), ignore_index=True)
+                elif _is_oai_source(self.metadata_path):
+                    self.metadata_df = next(read_oai_frames(self.metadata_path, columns))
+                    self.metadata_df = self.metadata_df.astype(self._metadata_dtypes(columns, self.metadata_df))
+                else:
+                    dtypes = self._metadata_dtypes(columns)
+                    self.metadata_df, self.metadata_encoding = read_csv(self.metadata_path, self.metadata_encoding, usecols=columns,
+                                                                        dtype=dtypes)
+            print(f"Metadata loaded successfully ({len(self.metadata_df)} rows, {len(columns)} columns).")
+            return True
+        except Exception as e:
+            self._report_error(f"An error occurred while loading metadata: {e}")
+            return False
+
+    def _harvest_frames(self, columns):
+        """Harvest the selected OAI-PMH sets concurrently, yielding a frame of the given columns per page.
+
+        Once every page is harvested, a ValueError is raised if one of the columns was found in none of the records.
+
+        """
+        fields = set()
+        for records in harvest_oai_pages(self.metadata_path, self.oai_sets, self.oai_prefix, self.oai_jobs, self.oai_retries,
+                                         self.oai_started):
+            for record in records:
+                fields.update(record)
+            yield pd.DataFrame([[record.get(col) for col in columns] for record in records], columns=columns)
+        _check_oai_fields(columns, fields)
+
+    def _metadata_dtypes(self, columns, sample=None):
+        """Choose categorical dtypes for the low-cardinality text columns; see metadata_dtypes."""
+        dtypes, self.metadata_encoding = metadata_dtypes(self.metadata_path, columns, self.identifier_column,
+                                                         self.metadata_encoding, sample)
+        return dtypes
 
     def select_columns(self, columns):
         """Select columns from the metadata for matching.
@@ -66,27 +1002,648 @@ class MaRMAT:
         """
         self.categories = categories
 
+    def select_engine(self, engine):
+        """Select the matching engine.
+
+        Parameters:
+        engine (str): 'automaton' to find all terms in a cell with one scan, 'vectorized' to match whole
+            columns with batched pandas string operations, 'lcsh' to match subject headings against an LCSH
+            lexicon heading by heading, or 'regex' to search row by row, one term at a time.
+
+        """
+        if engine not in ('automaton', 'vectorized', 'lcsh', 'regex'):
+            raise ValueError(f"Unknown matching engine: {engine}")
+        self.engine = engine
+
+    def select_lcsh_match(self, match):
+        """Select how the 'lcsh' engine matches subject headings against lexicon headings.
+
+        Parameters:
+        match (str): 'exact' for the same heading and subdivisions only, 'broader' to also match lexicon
+            headings that a subject heading is subdivided from, or 'heading' to match on the main heading only.
+            'heading' is broad: it reports every lexicon heading that shares a subject's main heading, whatever
+            the subdivisions of either, so it finds more candidates for review at the cost of false positives.
+
+        """
+        if match not in ('exact', 'broader', 'heading'):
+            raise ValueError(f"Unknown LCSH match mode: {match}")
+        self.lcsh_match = match
+
+    def select_variants(self, variants):
+        """Select whether to also match the singular and plural forms of the lexicon terms.
+
+        The forms are generated when the lexicon is compiled and matched in the same scan as the terms,
+        and a match of a form is reported as its lexicon term. Not used by the 'lcsh' engine.
+
+        Parameters:
+        variants (bool): True to match the singular and plural forms of the terms.
+
+        """
+        self.variants = variants
+
+    def select_fold_accents(self, fold_accents):
+        """Select whether to ignore accents when matching.
+
+        Terms and metadata are always matched after NFKC normalization and case folding; with accent
+        folding, accents and other combining marks are also removed, so 'Shiraoi-chō' matches 'shiraoi-cho'.
+
+        Parameters:
+        fold_accents (bool): True to remove accents before matching.
+
+        """
+        self.fold_accents = fold_accents
+
+    def select_workers(self, workers):
+        """Select the number of worker processes used for matching.
+
+        Parameters:
+        workers (int): Number of worker processes. 1 matches in the current process. The 'regex' engine always runs serially.
+
+        """
+        if workers < 1:
+            raise ValueError("The number of workers must be at least 1.")
+        self.workers = workers
+
+    def select_chunk_size(self, chunk_size):
+        """Select streaming mode, in which metadata is read and matched in chunks of rows.
+
+        In streaming mode load_metadata only reads the header of the metadata file, and perform_matching
+        appends the matches of each chunk to the output file, so memory use is bounded by the chunk size.
+        Select the chunk size before loading the metadata.
+
+        Parameters:
+        chunk_size (int or None): Number of metadata rows per chunk, or None to load the whole file at once.
+
+        """
+        if chunk_size is not None and chunk_size < 1:
+            raise ValueError("The chunk size must be at least 1.")
+        self.chunk_size = chunk_size
+
+    def select_cache(self, directory, max_bytes=DEFAULT_CACHE_BYTES):
+        """Enable the on-disk cache of compiled lexicons.
+
+        Parameters:
+        directory (str or None): Directory of the cache, or None to disable caching.
+        max_bytes (int): Maximum total size of the cache, in bytes.
+
+        """
+        self.lexicon_cache = LexiconCache(directory, max_bytes) if directory else None
+
+    def select_incremental(self, incremental):
+        """Select incremental mode, in which only records changed since the previous run are matched again.
+
+        Parameters:
+        incremental (bool): True to re-assess only changed and new records.
+
+        """
+        self.incremental = incremental
+
+    def select_lexicon_delta(self, lexicon_delta):
+        """Select lexicon delta mode, in which only terms added since the previous run are matched.
+
+        Parameters:
+        lexicon_delta (bool): True to scan the metadata for added terms only and merge the previous output.
+
+        """
+        self.lexicon_delta = lexicon_delta
+
+    def select_profile(self, profile):
+        """Select profiling, which reports where the time of a run goes.
+
+        Wall time and call counts are recorded per pipeline stage, per selected column and per lexicon
+        category, along with the slowest individual terms when the engine matches term by term. The report
+        is written next to the output file at the end of perform_matching. Select profiling before loading
+        files to include loading times.
+
+        Parameters:
+        profile (bool): True to profile the run.
+
+        """
+        self.profiler = Profiler() if profile else None
+
+    def select_count_occurrences(self, count_occurrences):
+        """Select whether to count how often each matched term occurs in its cell.
+
+        Occurrences are counted during the same scan that finds the matches and saved in a Count column,
+        so frequent terms can be prioritized without a second pass. Each match is still reported once
+        per identifier, term and column. The lcsh engine counts the matching subject headings of a cell.
+
+        Parameters:
+        count_occurrences (bool): True to add the Count column.
+
+        """
+        self.count_occurrences = count_occurrences
+
+    def select_summary(self, summary_format=None, summary_only=False):
+        """Select whether to save a summary with the number of matches and affected records per category, column and term.
+
+        The summary is updated as the matches of each chunk are found, so only the counts are kept in memory.
+        It is saved next to the output file, as <output_file>.summary.csv or .summary.json. With summary_only,
+        the summary is saved to the output file instead of the matches, and the metadata is streamed in chunks,
+        so neither the matches nor the metadata are held in memory in full.
+
+        Parameters:
+        summary_format (str or None): 'csv', 'json', or None for no summary ('csv' if summary_only is True).
+        summary_only (bool): True to save the summary only.
+
+        """
+        if summary_only and summary_format is None:
+            summary_format = 'csv'
+        if summary_format is not None and summary_format not in SUMMARY_EXTENSIONS:
+            raise ValueError(f"Unknown summary format: {summary_format}")
+        self.summary_format = summary_format
+        self.summary_only = summary_only
+
+    def select_oai_harvest(self, sets=None, metadata_prefix='qdc', jobs=4, retries=3):
+        """Select what to harvest when the metadata path is the base URL of an OAI-PMH endpoint.
+
+        Parameters:
+        sets (list of str): Sets to harvest, or None for every record of the repository.
+        metadata_prefix (str): Metadata format to request, e.g. 'qdc' or 'oai_dc'.
+        jobs (int): Number of sets harvested at the same time.
+        retries (int): Number of times a failed request is retried.
+
+        """
+        self.oai_sets = sets
+        self.oai_prefix = metadata_prefix
+        self.oai_jobs = jobs
+        self.oai_retries = retries
+        self.oai_started = {}  # Harvested with the previous selection
+
+    def select_output_format(self, output_format):
+        """Select the format of the output file.
+
+        Parquet and Arrow IPC output store Term, Category and Column dictionary-encoded, and require the
+        optional pyarrow package.
+
+        Parameters:
+        output_format (str): 'csv' (default), 'parquet' or 'arrow'.
+
+        """
+        self.output_format = output_format
+
+    def _report_error(self, message):
+        """Print an error message and keep it as the error of the tool, e.g. for the status of a batch file."""
+        self.error = message
+        print(message)
+
+    def _stage(self, name):
+        """Time a pipeline stage if profiling, or return a null context."""
+        return self.profiler.stage(name) if self.profiler else nullcontext()
+
     def perform_matching(self, output_file):
         """Perform matching between selected columns and categories and save results to a CSV file.
 
         Parameters:
-        output_file (str): Path to the output CSV file to save matching results.
+        output_file (str): Path to the output CSV file to save matching results, or the summary in summary-only mode.
+
+        Returns:
+        int or None: Number of matches saved, or None if the results could not be saved.
 
         """
-        if self.lexicon_df is None or self.metadata_df is None:
-            print("Please load lexicon and metadata files first.")
-            return
+        if self.lexicon_df is None or (self.metadata_df is None and self.metadata_path is None):
+            self._report_error("Please load lexicon and metadata files first.")
+            return None
+        streaming = self.chunk_size or _is_oai_harvest(self.metadata_path) or self.summary_only
+        if not streaming and not self.load_selected_metadata():
+            return None
+
+        match_count = None
+        if streaming:
+            if self.incremental or self.lexicon_delta:
+                print("Incremental and lexicon delta modes are not available in streaming or summary-only mode; assessing every record.")
+            match_count = self.perform_streaming_matching(output_file)
+        elif self.lexicon_delta:
+            match_count = self.perform_lexicon_delta_matching(output_file)
+        elif self.incremental:
+            match_count = self.perform_incremental_matching(output_file)
+        else:
+            matches_df = self.find_matches(self.selected_columns, self.categories)
+            print(matches_df)
+
+            """Write results to the output file"""
+            try:
+                self._write_matches(matches_df, output_file)
+                print(f"Results saved to {output_file}")
+                match_count = len(matches_df)
+            except Exception as e:
+                self._report_error(f"An error occurred while saving results: {e}")
+
+        if self.profiler is not None:
+            self.write_profile(output_file)
+        return match_count
 
-        matches = self.find_matches(self.selected_columns, self.categories)
-        matches_df = pd.DataFrame(matches, columns=['Identifier', 'Term', 'Category', 'Column'])
-        print(matches_df)
+    def perform_batch_matching(self, metadata_paths, output_dir, jobs=1):
+        """Match many metadata files with one compiled lexicon and write one output file per input.
 
-        """Write results to CSV"""
+        The lexicon is compiled once and shipped once to each job process. Files are matched concurrently
+        by up to jobs processes, each using the columns, identifier, categories and options of this tool.
+        An aggregate summary with the number of matches per file and category is saved to
+        batch-summary.csv in the output directory. In summary-only mode, the summary of each file
+        is saved instead of its matches.
+
+        Parameters:
+        metadata_paths (list of str): Metadata CSV files, directories of CSV files, or glob patterns.
+        output_dir (str): Directory to save the output files and summary to.
+        jobs (int): Number of metadata files matched at the same time.
+
+        Returns:
+        pandas.DataFrame: The summary, with one row per metadata file.
+
+        """
+        files = _expand_metadata_paths(metadata_paths)
+        if not files:
+            print("No metadata files found.")
+            return None
+        os.makedirs(output_dir, exist_ok=True)
+        outputs, used = [], set()
+        for file_path in files:
+            stem = os.path.splitext(os.path.basename(file_path))[0]
+            kind = 'summary' if self.summary_only else 'matches'
+            extension = SUMMARY_EXTENSIONS[self.summary_format] if self.summary_only else OUTPUT_EXTENSIONS[self.output_format]
+            name, suffix = f"{stem}-{kind}{extension}", 2
+            while name in used:
+                name, suffix = f"{stem}-{kind}-{suffix}{extension}", suffix + 1
+            used.add(name)
+            outputs.append(os.path.join(output_dir, name))
+
+        self.use_compiled_lexicon(self.compile_lexicon(self.categories))
+        template = copy.copy(self)
+        if jobs > 1:
+            template.workers = 1  # Concurrency comes from matching several files at once
+        if jobs <= 1:
+            _init_batch_worker(template)
+            results = [_match_batch_file(file_path, output_file) for file_path, output_file in zip(files, outputs)]
+        else:
+            with ProcessPoolExecutor(max_workers=jobs, initializer=_init_batch_worker, initargs=(template,)) as pool:
+                results = list(pool.map(_match_batch_file, files, outputs))
+        self.use_compiled_lexicon(None)
+
+        summary_df = pd.DataFrame(results)
+        counted = [category for category in self.categories if category in summary_df.columns]
+        summary_df[counted] = summary_df[counted].fillna(0).astype(int)
+        summary_path = os.path.join(output_dir, 'batch-summary.csv')
         try:
-            matches_df.to_csv(output_file, index=False)
+            summary_df.to_csv(summary_path, index=False)
+            failed = summary_df[summary_df['Status'] != 'ok']
+            print(f"{len(summary_df) - len(failed)} of {len(summary_df)} files matched, "
+                  f"{int(summary_df['Matches'].sum())} matches in total. Summary saved to {summary_path}")
+            for file_path, status in zip(failed['File'], failed['Status']):
+                print(f"  {file_path}: {status}")
+        except Exception as e:
+            print(f"An error occurred while saving the batch summary: {e}")
+        return summary_df
+
+    def write_profile(self, output_file):
+        """Print the profiling report and save it as JSON and text next to an output file.
+
+        Parameters:
+        output_file (str): Path of the output CSV file; the report is saved to <output_file>.profile.json and .txt.
+
+        """
+        report = self.profiler.report()
+        text = self.profiler.format_text(report)
+        print(text)
+        try:
+            with open(output_file + '.profile.json', 'w', encoding='utf-8') as report_file:
+                json.dump(report, report_file, indent=2)
+            with open(output_file + '.profile.txt', 'w', encoding='utf-8') as report_file:
+                report_file.write(text)
+            print(f"Profile saved to {output_file}.profile.json")
+        except Exception as e:
+            print(f"An error occurred while saving the profile: {e}")
+
+    def perform_streaming_matching(self, output_file):
+        """Match the metadata file chunk by chunk, appending the results of each chunk to a CSV file.
+
+        The output is the same as the output of perform_matching, but neither the metadata nor the matches
+        are ever held in memory in full. Records harvested from an OAI-PMH endpoint are matched page by page,
+        in the order the pages arrive. If a summary is selected, it is updated with the matches of each chunk.
+
+        Parameters:
+        output_file (str): Path to the output file to save matching results, or the summary in summary-only mode.
+
+        """
+        compiled = self.compile_lexicon(self.categories)
+        columns = list(dict.fromkeys(self.selected_columns + [self.identifier_column]))
+        chunk_size = self.chunk_size or SUMMARY_CHUNK_ROWS
+        self.summary = MatchSummary(self.count_occurrences) if self.summary_format else None
+        row_count = match_count = 0
+        try:
+            writer = nullcontext() if self.summary_only else MatchWriter(output_file, self.output_format, self._output_columns())
+            with writer as output, self._worker_pool(compiled) as pool:
+                if _is_oai_harvest(self.metadata_path):
+                    chunks = self._harvest_frames(columns)
+                elif _is_oai_source(self.metadata_path):
+                    chunks = read_oai_frames(self.metadata_path, columns, chunk_size)
+                else:
+                    dtypes = self._metadata_dtypes(columns)  # May find the file is Latin-1, so read before the encoding
+                    chunks = iter(pd.read_csv(self.metadata_path, encoding=self.metadata_encoding, usecols=columns,
+                                              dtype=dtypes, chunksize=chunk_size))
+                while True:
+                    with self._stage('load metadata'):
+                        chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    matches = self._find_frame_matches(chunk, self.selected_columns, compiled, pool)
+                    if output is not None:
+                        with self._stage('write results'):
+                            output.write(matches)
+                    if self.summary is not None:
+                        with self._stage('summarize'):
+                            self.summary.add(matches, len(chunk))
+                    row_count += len(chunk)
+                    match_count += len(matches)
+                    print(f"Processed {row_count} rows, {match_count} matches found.")
+            if output is not None:
+                print(f"Results saved to {output_file}")
+            if self.summary is not None:
+                self._write_summary(output_file)
+            return match_count
+        except UnicodeDecodeError as e:
+            if self.metadata_encoding == 'latin1':
+                self._report_error(f"An error occurred while matching in streaming mode: {e}")
+                return None
+            # Bytes past the sample the encoding was detected from are not UTF-8, so start over in Latin-1
+            print("The metadata file is not valid UTF-8 throughout; matching it again as Latin-1.")
+            self.metadata_encoding = 'latin1'
+            return self.perform_streaming_matching(output_file)
+        except Exception as e:
+            self._report_error(f"An error occurred while matching in streaming mode: {e}")
+            return None
+
+    def perform_incremental_matching(self, output_file):
+        """Re-assess only the records that changed since the previous run saved to the same output file.
+
+        A content hash of each record (its identifier and selected columns) is saved next to the output
+        file. On the next run, records whose hash is unchanged keep the matches of the previous output,
+        changed and new records are matched again, and matches of deleted records are dropped. Records whose
+        identifier is shared by several rows are always matched again. If the lexicon, categories, columns
+        or matching options differ from the previous run, every record is matched.
+
+        Parameters:
+        output_file (str): Path to the output file to save matching results.
+
+        """
+        record_hashes = self._record_hashes(self.metadata_df)
+        state = self._read_run_state(output_file)
+        previous_hashes = {}
+        if state is not None and state['fingerprint'] == self._run_fingerprint() and os.path.exists(output_file):
+            previous_hashes = state['records']
+
+        unchanged = {identifier for identifier, record_hash in record_hashes.items()
+                     if previous_hashes.get(identifier) == record_hash}
+        print(f"{len(unchanged)} records unchanged, {len(record_hashes) - len(unchanged)} changed or new, "
+              f"{len(set(previous_hashes) - set(record_hashes))} deleted.")
+        # The output does not tell which row of an identifier shared by several rows a match came from, so
+        # those records are matched again to place their matches as a full run would
+        unchanged -= self._shared_identifiers()
+        changed_rows = ~self.metadata_df[self.identifier_column].map(str).isin(unchanged).to_numpy()
+
+        try:
+            compiled = self.compile_lexicon(self.categories)
+            with self._worker_pool(compiled) as pool:
+                matches_df = self._find_rows_matches(changed_rows, compiled, pool)
+            if unchanged:
+                previous_df = read_matches(output_file, self.output_format)
+                carried_df = previous_df[previous_df['Identifier'].map(str).isin(unchanged)]
+                matches_df = pd.concat([matches_df.astype({'Identifier': object}), carried_df], ignore_index=True)
+
+            matches_df = self._sort_matches(matches_df, compiled)
+            self._write_matches(matches_df, output_file)
+            self._write_run_state(output_file, record_hashes, compiled)
+            print(f"Results saved to {output_file}")
+            return len(matches_df)
+        except Exception as e:
+            self._report_error(f"An error occurred while matching in incremental mode: {e}")
+            return None
+
+    def perform_lexicon_delta_matching(self, output_file):
+        """Update the output of the previous run after terms were added to or removed from the lexicon.
+
+        The selected lexicon terms are compared with the terms used by the previous run saved to the same
+        output file. The metadata is scanned for the added terms only, matches of removed terms are
+        filtered out of the previous output, and the two are merged in the order of a full run. If the
+        metadata, columns or matching options changed since the previous run, every term is matched.
+
+        Parameters:
+        output_file (str): Path to the output file to save matching results.
+
+        """
+        record_hashes = self._record_hashes(self.metadata_df)
+        state = self._read_run_state(output_file)
+        try:
+            compiled = self.compile_lexicon(self.categories)
+            lexicon = list(zip(compiled.terms, compiled.categories))
+            comparable = (state is not None and 'lexicon' in state and os.path.exists(output_file)
+                          and state['records'] == record_hashes and self._same_run_setup(state['fingerprint']))
+            if comparable:
+                # A term listed several times in the lexicon is matched once per listing, so listings are counted
+                previous_lexicon = Counter(tuple(pair) for pair in state['lexicon'])
+                added = list((Counter(lexicon) - previous_lexicon).elements())
+                removed = previous_lexicon - Counter(lexicon)
+                print(f"{len(added)} terms added and {sum(removed.values())} terms removed since the previous run.")
+                if self.variants:
+                    # A variant that is also a term is left to that term, so adding or removing a term moves
+                    # its form between terms; the terms that have it as a variant are matched again, and so is a
+                    # term that only lost some of its listings, which still holds its form
+                    changed = {normalize_text(term, self.fold_accents) for term, category in added + list(removed)
+                               if isinstance(term, str)}
+                    moved = [(term, category) for term, category in lexicon if (term, category) not in added and isinstance(term, str)
+                             and changed.intersection([normalize_text(term, self.fold_accents),
+                                                       *term_variants(normalize_text(term, self.fold_accents))])]
+                    added += moved
+                    for pair in moved:
+                        removed[pair] = previous_lexicon[pair]
+                delta = CompiledLexicon([term for term, category in added], [category for term, category in added],
+                                        **self._compile_options())
+            else:
+                print("No comparable previous run found; matching every term.")
+                delta = compiled
+
+            # Records whose identifier is shared by several rows are matched again with every term, as in
+            # incremental mode, since the previous output does not tell their rows apart
+            shared = self._shared_identifiers() if comparable else set()
+            shared_rows = self.metadata_df[self.identifier_column].map(str).isin(shared).to_numpy()
+            with self._worker_pool(delta) as pool:
+                matches_df = self._find_rows_matches(~shared_rows, delta, pool)
+            if comparable:
+                previous_df = read_matches(output_file, self.output_format)
+                # Of the matches of a term whose listings were partly removed, those of the remaining listings are kept
+                listing = previous_df.groupby(['Identifier', 'Column', 'Term', 'Category'], sort=False, observed=True,
+                                              dropna=False).cumcount().to_numpy()
+                kept = [str(identifier) not in shared and ((term, category) not in removed
+                                                           or index < previous_lexicon[term, category] - removed[term, category])
+                        for identifier, term, category, index
+                        in zip(previous_df['Identifier'], previous_df['Term'], previous_df['Category'], listing)]
+                matches_df = pd.concat([matches_df.astype({'Identifier': object}), previous_df[kept]], ignore_index=True)
+                if shared:
+                    shared_df = self._find_rows_matches(shared_rows, compiled)
+                    matches_df = pd.concat([matches_df, shared_df.astype({'Identifier': object})], ignore_index=True)
+
+            matches_df = self._sort_matches(matches_df, compiled)
+            self._write_matches(matches_df, output_file)
+            self._write_run_state(output_file, record_hashes, compiled)
             print(f"Results saved to {output_file}")
+            return len(matches_df)
         except Exception as e:
-            print(f"An error occurred while saving results: {e}")
+            self._report_error(f"An error occurred while matching in lexicon delta mode: {e}")
+            return None
+
+    def _write_matches(self, matches_df, output_file):
+        """Write a table of matches to the output file in the selected output format, and its summary if selected."""
+        with self._stage('write results'), MatchWriter(output_file, self.output_format, self._output_columns()) as output:
+            output.write(matches_df)
+        if self.summary_format:
+            with self._stage('summarize'):
+                self.summary = MatchSummary(self.count_occurrences)
+                self.summary.add(matches_df, len(self.metadata_df))
+            self._write_summary(output_file)
+
+    def _write_summary(self, output_file):
+        """Save the summary of the last run next to the output file, or to the output file in summary-only mode."""
+        path = output_file if self.summary_only else output_file + '.summary' + SUMMARY_EXTENSIONS[self.summary_format]
+        with self._stage('write summary'):
+            self.summary.write(path, self.summary_format)
+        print(f"Summary saved to {path}")
+
+    def _output_columns(self):
+        """Return the columns of the match table, including Count when occurrences are counted."""
+        return MATCH_COLUMNS + ['Count'] if self.count_occurrences else MATCH_COLUMNS
+
+    def _sort_matches(self, matches_df, compiled):
+        """Sort matches merged from several runs into the order of a single full run.
+
+        Matches are ordered by metadata row, then selected column, then lexicon order. Matches found in
+        this run carry the position of their row in a Row column (see _find_rows_matches), which is
+        dropped; matches carried over from the previous output belong to records with a single row,
+        which is looked up from their identifier.
+
+        """
+        identifiers = self.metadata_df[self.identifier_column].map(str).tolist()
+        record_rows = {identifier: position for position, identifier in enumerate(identifiers)}
+        col_positions = {col: position for position, col in reversed(list(enumerate(self.selected_columns)))}
+        term_positions = {}
+        for position, pair in enumerate(zip(compiled.terms, compiled.categories)):
+            term_positions.setdefault(pair, []).append(position)
+        rows = [record_rows[str(identifier)] if pd.isna(row) else row for identifier, row in zip(matches_df['Identifier'], matches_df['Row'])]
+        cols = [col_positions[col] for col in matches_df['Column']]
+        # A term listed several times in the lexicon matches a cell once per listing, in lexicon order
+        listings = Counter()
+        term_keys = []
+        for row, col, pair in zip(rows, cols, zip(matches_df['Term'], matches_df['Category'])):
+            positions = term_positions[pair]
+            term_keys.append(positions[min(listings[row, col, pair], len(positions) - 1)])
+            listings[row, col, pair] += 1
+        return matches_df.iloc[np.lexsort((term_keys, cols, rows))].drop(columns='Row')
+
+    def _find_rows_matches(self, rows, compiled, pool=None):
+        """Match the metadata rows selected by a boolean mask, with a Row column giving the metadata position of each match."""
+        positions = np.flatnonzero(rows)
+        matches_df = self._find_frame_matches(self.metadata_df.iloc[positions], self.selected_columns, compiled, pool,
+                                              row_positions=True)
+        matches_df['Row'] = positions[matches_df['Row'].to_numpy(dtype=np.int64)]
+        return matches_df
+
+    def _shared_identifiers(self):
+        """Return the identifiers, as strings, that several metadata rows share."""
+        identifiers = self.metadata_df[self.identifier_column].map(str)
+        return set(identifiers[identifiers.duplicated()])
+
+    def _record_hashes(self, frame):
+        """Hash the identifier and selected columns of each record.
+
+        Returns:
+        dict: Content hash of each identifier, as a hex string. Rows sharing an identifier are hashed together.
+
+        """
+        columns = list(dict.fromkeys([self.identifier_column] + self.selected_columns))
+        row_hashes = pd.util.hash_pandas_object(frame[columns], index=False).to_numpy()
+        identifiers = frame[self.identifier_column].map(str).tolist()
+        record_hashes = {}
+        for identifier, row_hash in zip(identifiers, row_hashes.tolist()):
+            record_hashes.setdefault(identifier, hashlib.sha256()).update(row_hash.to_bytes(8, 'little'))
+        return {identifier: record_hash.hexdigest() for identifier, record_hash in record_hashes.items()}
+
+    def _run_fingerprint(self):
+        """Describe the lexicon, categories, columns and options of a run, to tell whether two runs are comparable."""
+        fingerprint = {
+            'lexicon_hash': self.lexicon_hash,
+            'categories': sorted(set(self.categories)),
+            'columns': self.selected_columns,
+            'identifier_column': self.identifier_column,
+            'options': self._compile_options(),
+        }
+        if self.count_occurrences:
+            fingerprint['count_occurrences'] = True  # Only recorded when set, so earlier run states stay comparable
+        return fingerprint
+
+    def _same_run_setup(self, fingerprint):
+        """Return True if a run fingerprint has the same columns, identifier and options as this run."""
+        current = self._run_fingerprint()
+        return all(fingerprint.get(key) == current.get(key) for key in ('columns', 'identifier_column', 'options', 'count_occurrences'))
+
+    def _read_run_state(self, output_file):
+        """Read the run state saved next to an output file, or return None if there is none."""
+        try:
+            with open(output_file + '.state.json', encoding='utf-8') as state_file:
+                return json.load(state_file)
+        except (OSError, ValueError):
+            return None
+
+    def _write_run_state(self, output_file, record_hashes, compiled):
+        """Save the run state, including the record hashes and the selected lexicon terms, next to an output file."""
+        lexicon = [[term, category] for term, category in zip(compiled.terms, compiled.categories)]
+        state = {'fingerprint': self._run_fingerprint(), 'records': record_hashes, 'lexicon': lexicon}
+        with open(output_file + '.state.json', 'w', encoding='utf-8') as state_file:
+            json.dump(state, state_file)
+
+    def compile_lexicon(self, selected_categories):
+        """Compile the lexicon terms of the selected categories for the selected matching engine.
+
+        If the compiled lexicon cache is enabled, a lexicon compiled by an earlier run is reused.
+
+        Parameters:
+        selected_categories (list of str): List of category names from the lexicon for matching.
+
+        Returns:
+        CompiledLexicon: The compiled lexicon.
+
+        """
+        if self.compiled_lexicon is not None:
+            return self.compiled_lexicon
+
+        key = None
+        if self.lexicon_cache is not None and self.lexicon_hash is not None:
+            key = self.lexicon_cache.key(self.lexicon_hash, selected_categories, self._compile_options())
+            compiled = self.lexicon_cache.get(key)
+            if compiled is not None:
+                return compiled
+
+        with self._stage('compile lexicon'):
+            lexicon_df = self.lexicon_df[self.lexicon_df['category'].isin(selected_categories)]
+            compiled = CompiledLexicon(lexicon_df['term'].tolist(), lexicon_df['category'].tolist(), **self._compile_options())
+        if key is not None:
+            self.lexicon_cache.put(key, compiled)
+        return compiled
+
+    def use_compiled_lexicon(self, compiled):
+        """Reuse an already compiled lexicon for every following run, instead of compiling the lexicon.
+
+        Parameters:
+        compiled (CompiledLexicon or None): The compiled lexicon, or None to compile the lexicon again.
+
+        """
+        self.compiled_lexicon = compiled
+
+    def _compile_options(self):
+        """Return the options the lexicon is compiled with, as keyword arguments of CompiledLexicon."""
+        options = {'engine': self.engine, 'lcsh_match': self.lcsh_match}
+        if self.variants:
+            options['variants'] = True  # Only included when set, so earlier cache keys and run states stay valid
+        if self.fold_accents:
+            options['fold_accents'] = True
+        return options
 
     def find_matches(self, selected_columns, selected_categories):
         """Find matches between metadata and lexicon based on selected columns and categories.
@@ -96,29 +1653,207 @@ class MaRMAT:
         selected_categories (list of str): List of category names from the lexicon for matching.
 
         Returns:
-        list of tuple: List of tuples containing matched results (Identifier, Term, Category, Column).
+        pandas.DataFrame: Table of matched results (Identifier, Term, Category, Column, and Count when
+        occurrences are counted), in which Term, Category and Column are dictionary-encoded as categoricals.
+
+        """
+        if not self.load_selected_metadata(selected_columns):
+            return pd.DataFrame(columns=self._output_columns())
+        compiled = self.compile_lexicon(selected_categories)
+        with self._worker_pool(compiled) as pool:
+            return self._find_frame_matches(self.metadata_df, selected_columns, compiled, pool)
+
+    def _find_frame_matches(self, frame, selected_columns, compiled, pool=None, row_positions=False):
+        """Find the matches in a frame of metadata rows with a compiled lexicon.
+
+        If row_positions is True, a Row column gives the position within the frame of the row of each match.
 
         """
-        matches = []
-        lexicon_df = self.lexicon_df[self.lexicon_df['category'].isin(selected_categories)]
-        for index, row in self.metadata_df.iterrows():
-            for col in selected_columns:
+        if self.engine != 'regex':
+            with self._stage('match'):
+                rows, cols, term_ids, occurrences = self._match_metadata(frame, selected_columns, compiled, pool)
+            return self._assemble_matches(frame, rows, cols, term_ids, selected_columns, compiled,
+                                          occurrences if self.count_occurrences else None, row_positions)
+
+        with self._stage('match'):
+            return self._find_matches_row_by_row(frame, selected_columns, compiled, row_positions)
+
+    def _find_matches_row_by_row(self, frame, selected_columns, compiled, row_positions=False):
+        """Find matches row by row, running one regular expression search per term and cell.
+
+        Each cell is normalized once, before its terms are searched.
+
+        """
+        identifiers, term_ids, cols, occurrences, rows = [], [], [], [], []
+        profiler = self.profiler
+        for position, (index, row) in enumerate(frame.iterrows()):
+            for col_position, col in enumerate(selected_columns):
                 if isinstance(row[col], str):
-                    for term, category in zip(lexicon_df['term'], lexicon_df['category']):
-                        if re.search(r'\b' + re.escape(term.lower()) + r'\b', row[col].lower()):
-                            matches.append((row[self.identifier_column], term, category, col))
-        return matches
+                    column_start = time.perf_counter()
+                    text = normalize_text(row[col], compiled.fold_accents)
+                    for term_index, (term, category) in enumerate(zip(compiled.terms, compiled.categories)):
+                        start = time.perf_counter()
+                        pattern = compiled.term_patterns[term_index]
+                        if pattern is None:
+                            continue
+                        found = len(pattern.findall(text)) if self.count_occurrences else pattern.search(text)
+                        if profiler:
+                            profiler.add(profiler.terms, (term, category), time.perf_counter() - start)
+                        if found:
+                            identifiers.append(row[self.identifier_column])
+                            term_ids.append(term_index)
+                            cols.append(col_position)
+                            occurrences.append(found if self.count_occurrences else 1)
+                            rows.append(position)
+                            if profiler:
+                                profiler.matches[(term, category)] = profiler.matches.get((term, category), 0) + 1
+                    if profiler:
+                        profiler.add(profiler.columns, col, time.perf_counter() - column_start)
+        matches_df = _match_table(identifiers, term_ids, cols, selected_columns, compiled,
+                                  occurrences if self.count_occurrences else None)
+        if row_positions:
+            matches_df['Row'] = np.asarray(rows, dtype=np.int64)
+        return matches_df
+
+    def _worker_pool(self, compiled):
+        """Start a process pool that has received the compiled lexicon, or return a null context for a serial run."""
+        if self.workers <= 1 or self.engine == 'regex':
+            return nullcontext()
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker, initargs=(_match_frame, compiled))
+
+    def _match_metadata(self, frame, selected_columns, compiled, pool=None):
+        """Match a frame of metadata, sharding its rows across the process pool if there is one.
+
+        Shards are contiguous blocks of rows and their results are merged in original row order,
+        so a parallel run returns exactly the same matches as a serial run.
+
+        """
+        frame = frame[list(dict.fromkeys(selected_columns))]
+        shard_count = min(len(frame), self.workers * 4)
+        if pool is None or shard_count <= 1:
+            return _match_frame(frame, selected_columns, compiled, profiler=self.profiler, counts=self.count_occurrences)
+
+        bounds = np.linspace(0, len(frame), shard_count + 1).astype(int)
+        shards = [frame.iloc[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+        # Columns and terms are not timed inside worker processes
+        results = list(pool.map(match_shard, shards, [selected_columns] * len(shards), bounds[:-1].tolist(),
+                                [{'counts': self.count_occurrences}] * len(shards)))
+        return tuple(np.concatenate(parts) for parts in zip(*results))
+
+    def _assemble_matches(self, frame, rows, cols, term_ids, selected_columns, compiled, occurrences=None,
+                          row_positions=False):
+        """Build the match table from parallel arrays of row positions, column positions and term indexes.
+
+        Matches are ordered by row, then selected column, then lexicon order, as in a row-by-row scan.
+        Occurrence counts, if given, are added as a Count column, and row positions as a Row column if
+        row_positions is True.
+
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        terms, categories = compiled.terms, compiled.categories
+        if self.profiler:
+            self.profiler.count_matches(terms, categories, term_ids)
+        with self._stage('assemble matches'):
+            order = np.lexsort((term_ids, cols, rows))
+            identifiers = frame[self.identifier_column].to_numpy()[rows[order]]
+            matches_df = _match_table(identifiers, term_ids[order], cols[order], selected_columns, compiled,
+                                      None if occurrences is None else np.asarray(occurrences, dtype=np.int64)[order])
+            if row_positions:
+                matches_df['Row'] = rows[order]
+            return matches_df
 
 # Main program for command line interaction
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Marriott Reparative Metadata Assessment Tool (MaRMAT)")
+    parser.add_argument("--engine", choices=['automaton', 'vectorized', 'lcsh', 'regex'], default='automaton',
+                        help="matching engine; use 'lcsh' to match subject headings against an LCSH lexicon (default: automaton)")
+    parser.add_argument("--lcsh-match", choices=['exact', 'broader', 'heading'], default='broader',
+                        help="how the lcsh engine matches headings: same heading only, also narrower subject headings, "
+                             "or main heading only, a broad mode that reports every lexicon heading sharing a subject's "
+                             "main heading whatever the subdivisions (default: broader)")
+    parser.add_argument("--variants", action="store_true",
+                        help="also match the singular and plural forms of the lexicon terms, reported as the terms themselves")
+    parser.add_argument("--fold-accents", action="store_true",
+                        help="ignore accents when matching, so that 'cho' matches 'chō'")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes used for matching (default: 1)")
+    parser.add_argument("--chunk-size", type=int, default=None,
+                        help="stream the metadata file in chunks of this many rows to bound memory use")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only re-assess records that changed since the previous run saved to the same output file")
+    parser.add_argument("--lexicon-delta", action="store_true",
+                        help="only match lexicon terms added since the previous run saved to the same output file")
+    parser.add_argument("--count-occurrences", action="store_true",
+                        help="add a Count column with the number of times each matched term occurs in its cell")
+    parser.add_argument("--summary", choices=list(SUMMARY_EXTENSIONS), default=None,
+                        help="also save the number of matches and affected records per category, column and term, "
+                             "next to the output file as <output>.summary.csv or .json")
+    parser.add_argument("--summary-only", action="store_true",
+                        help="save the summary instead of the matches, streaming the metadata (summary format: csv unless --summary is given)")
+    parser.add_argument("--profile", action="store_true",
+                        help="report wall time per stage, column and lexicon category and the slowest terms")
+    parser.add_argument("--output-format", choices=list(OUTPUT_EXTENSIONS), default='csv',
+                        help="format of the output file; parquet and arrow require pyarrow (default: csv)")
+    parser.add_argument("--cache-dir", default=None, help="directory in which compiled lexicons are cached between runs")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_BYTES // (1024 * 1024),
+                        help="maximum size of the compiled lexicon cache in megabytes (default: %(default)s)")
+    harvest = parser.add_argument_group("OAI-PMH harvesting", "used when the metadata path is the base URL of an OAI-PMH endpoint")
+    harvest.add_argument("--oai-set", nargs='+', default=None, help="sets to harvest (default: every record)")
+    harvest.add_argument("--oai-prefix", default='qdc', help="metadata format to request (default: qdc)")
+    harvest.add_argument("--oai-jobs", type=int, default=4, help="number of sets harvested at the same time (default: 4)")
+    harvest.add_argument("--oai-retries", type=int, default=3, help="number of times a failed request is retried (default: 3)")
+    batch = parser.add_argument_group("batch mode", "match metadata files without prompts; enabled by --metadata")
+    batch.add_argument("--lexicon", help="path to the lexicon CSV file")
+    batch.add_argument("--metadata", nargs='+',
+                       help="metadata CSV or OAI-PMH XML files, directories of such files or glob patterns to match")
+    batch.add_argument("--columns", help="column names for matching, separated by commas")
+    batch.add_argument("--identifier", help="name of the identifier column")
+    batch.add_argument("--categories", help="lexicon categories for matching, separated by commas (default: all)")
+    batch.add_argument("--output-dir", default=".", help="directory to save the output files to (default: current directory)")
+    batch.add_argument("--jobs", type=int, default=1, help="number of metadata files matched at the same time (default: 1)")
+    args = parser.parse_args()
+
+    if args.metadata:
+        missing = [option for option, value in (("--lexicon", args.lexicon), ("--columns", args.columns),
+                                                ("--identifier", args.identifier)) if not value]
+        if missing:
+            parser.error(f"batch mode requires {', '.join(missing)}")
+
     print("1. Initialize the tool:")
     tool = MaRMAT()
+    tool.select_profile(args.profile)
+    tool.select_engine(args.engine)
+    tool.select_lcsh_match(args.lcsh_match)
+    tool.select_variants(args.variants)
+    tool.select_fold_accents(args.fold_accents)
+    tool.select_workers(args.workers)
+    tool.select_chunk_size(args.chunk_size)
+    tool.select_incremental(args.incremental)
+    tool.select_lexicon_delta(args.lexicon_delta)
+    tool.select_cache(args.cache_dir, args.cache_size * 1024 * 1024)
+    tool.select_output_format(args.output_format)
+    tool.select_count_occurrences(args.count_occurrences)
+    tool.select_summary(args.summary, args.summary_only)
+    tool.select_oai_harvest(args.oai_set, args.oai_prefix, args.oai_jobs, args.oai_retries)
+
+    if args.metadata:
+        tool.load_lexicon(args.lexicon)
+        if tool.lexicon_df is not None:
+            tool.select_columns([col.strip() for col in args.columns.split(",")])
+            tool.select_identifier_column(args.identifier.strip())
+            if args.categories:
+                tool.select_categories([cat.strip() for cat in args.categories.split(",")])
+            else:
+                tool.select_categories(tool.lexicon_df['category'].dropna().unique().tolist())
+            tool.perform_batch_matching(args.metadata, args.output_dir, args.jobs)
+        raise SystemExit
 
     print("\n2. Load lexicon and metadata files:")
     lexicon_path = input("Enter the path to the lexicon CSV file: ")
     tool.load_lexicon(lexicon_path)
     
-    metadata_path = input("Enter the path to the metadata CSV file: ")
+    metadata_path = input("Enter the path to the metadata CSV file (or OAI-PMH XML file or endpoint URL): ")
     tool.load_metadata(metadata_path)
 
     print("\n3. Select columns for matching:")
@@ -134,5 +1869,8 @@ if __name__ == "__main__":
     tool.select_categories([cat.strip() for cat in categories])  # Strip whitespace
 
     print("\n6. Perform matching and view results:")
-    output_file = input("Enter the path to save the output CSV file: ")
+    if tool.summary_only:
+        output_file = input(f"Enter the path to save the summary {tool.summary_format.upper()} file: ")
+    else:
+        output_file = input(f"Enter the path to save the output {args.output_format.upper()} file: ")
     tool.perform_matching(output_file)
@@ -0,0 +1,701 @@
+"""Matching engine shared by the MaRMAT command-line tool and GUI.
+
+Holds the metadata readers (CSV and streamed OAI-PMH records), the text normalization, lexicon term
+variants, the Aho-Corasick lexicon matcher and the run profiler, so that both front ends find the same
+matches in the same way.
+
+"""
+import codecs
+import importlib.util
+import re
+import sys
+import time
+import unicodedata
+import xml.etree.ElementTree as ET
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
+
+
+def lazy_import(name):
+    """Return a module that is only imported when one of its attributes is first used.
+
+    pandas and numpy take about a second to import, so loading them lazily lets the command-line prompts
+    and the GUI window appear immediately; they are imported when the first file is loaded.
+
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+CATEGORY_SAMPLE_ROWS = 10000  # Rows sampled to find the low-cardinality text columns of a metadata file
+CATEGORY_MAX_RATIO = 0.5  # Text columns with at most this share of distinct values are read as categoricals
+OAI_NAMESPACES = {  # Prefixes used to name the fields of OAI-PMH records
+    'http://www.openarchives.org/OAI/2.0/': 'oai',
+    'http://purl.org/dc/elements/1.1/': 'dc',
+    'http://purl.org/dc/terms/': 'dcterms',
+}
+NORMALIZE_CACHE_SIZE = 65536  # Distinct non-ASCII cell values whose normalized text is memoized
+IRREGULAR_PLURALS = {  # Singular and plural forms that the suffix rules of term_variants do not produce
+    'man': 'men', 'woman': 'women', 'child': 'children', 'wife': 'wives', 'life': 'lives',
+    'foot': 'feet', 'tooth': 'teeth', 'mouse': 'mice', 'goose': 'geese', 'ox': 'oxen',
+}
+IRREGULAR_SUFFIXES = ('man', 'woman', 'wife')  # Irregular forms that are also inflected in compounds, as in 'chairman'
+
+
+def _is_word_char(char):
+    """Return True if the character counts as a word character for the regex \\b anchor."""
+    return char.isalnum() or char == '_'
+
+
+def _is_word_boundary(text, position):
+    """Return True if a regex \\b anchor would match at the given position in the text."""
+    before = position > 0 and _is_word_char(text[position - 1])
+    after = position < len(text) and _is_word_char(text[position])
+    return before != after
+
+
+def detect_encoding(file, sample_size=1024 * 1024):
+    """Detect whether a CSV file is encoded in UTF-8 or in Latin-1, from a sample at its start.
+
+    Only the first sample_size bytes are decoded, so a file is loaded as quickly whatever its size; a
+    character cut off at the end of the sample does not count as invalid. Invalid bytes past the sample
+    are caught when the file is read; see read_csv.
+
+    Parameters:
+    file (file object): The file, opened in binary mode at its start.
+    sample_size (int): Bytes decoded.
+
+    Returns:
+    str: 'utf-8-sig' for UTF-8 with a byte order mark, 'utf-8', or 'latin1', which decodes any bytes.
+
+    """
+    sample = file.read(sample_size)
+    encoding = 'utf-8-sig' if sample.startswith(codecs.BOM_UTF8) else 'utf-8'
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=len(sample) < sample_size)
+    except UnicodeDecodeError:
+        return 'latin1'
+    return encoding
+
+
+def read_csv(source, encoding, **options):
+    """Read a CSV file with pandas, reading it again as Latin-1 if it is not valid UTF-8 after all.
+
+    Parameters:
+    source (str or file object): Path of the CSV file, or the file opened in binary mode.
+    encoding (str): Encoding returned by detect_encoding.
+    options: Further arguments of pandas.read_csv.
+
+    Returns:
+    tuple: The DataFrame, and the encoding it was read with.
+
+    """
+    try:
+        return pd.read_csv(source, encoding=encoding, **options), encoding
+    except UnicodeDecodeError:
+        if encoding == 'latin1':
+            raise
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        return pd.read_csv(source, encoding='latin1', **options), 'latin1'
+
+
+def read_header(path):
+    """Detect the encoding of a metadata CSV file and read its column names, without parsing its rows.
+
+    Parameters:
+    path (str): Path to the metadata CSV file.
+
+    Returns:
+    tuple: The column names, and the encoding of the file (see detect_encoding).
+
+    """
+    with open(path, 'rb') as metadata_file:
+        encoding = detect_encoding(metadata_file)
+    return pd.read_csv(path, encoding=encoding, nrows=0).columns.tolist(), encoding
+
+
+def metadata_dtypes(path, columns, identifier, encoding='utf-8', sample=None):
+    """Choose categorical dtypes for the low-cardinality text columns, from a sample of a metadata file.
+
+    Columns that pandas reads as numbers stay numeric, so the same cells are matched as when reading
+    every column. The identifier column is never made categorical.
+
+    Parameters:
+    path (str): Path of the metadata CSV file, read only if no sample is given.
+    columns (list of str): Columns to be read.
+    identifier (str): Identifier column.
+    encoding (str): Encoding of the file (see detect_encoding).
+    sample (pandas.DataFrame): Rows already read, such as OAI-PMH records, or None to read the file.
+
+    Returns:
+    tuple: The dtype of each categorical column, and the encoding of the file (see read_csv).
+
+    """
+    if sample is None:
+        sample, encoding = read_csv(path, encoding, usecols=columns, nrows=CATEGORY_SAMPLE_ROWS)
+    sample = sample.head(CATEGORY_SAMPLE_ROWS)
+    dtypes = {}
+    for col in columns:
+        values = sample[col].dropna()
+        is_text = pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values)
+        if col != identifier and len(values) and is_text and values.nunique() <= len(values) * CATEGORY_MAX_RATIO:
+            dtypes[col] = 'category'
+    return dtypes, encoding
+
+
+def factorize_text(values):
+    """Dictionary-encode the text cells of a metadata column, so that each distinct value is matched once.
+
+    Parameters:
+    values (pandas.Series): Cells of the column.
+
+    Returns:
+    tuple: Positions of the text cells within values, the code of each text cell's distinct value, and
+    the distinct values.
+
+    """
+    is_text = values.map(lambda value: isinstance(value, str)).to_numpy(dtype=bool)
+    texts = values[is_text]
+    # Categorical columns are factorized from their codes
+    codes, uniques = pd.factorize(texts if isinstance(texts.dtype, pd.CategoricalDtype) else texts.astype(object))
+    return np.flatnonzero(is_text), codes, uniques
+
+
+def _field_name(tag):
+    """Name a record field after its XML tag, e.g. 'dc:title' for {http://purl.org/dc/elements/1.1/}title."""
+    namespace, _, local_name = tag[1:].rpartition('}') if tag.startswith('{') else ('', '', tag)
+    prefix = OAI_NAMESPACES.get(namespace)
+    return f"{prefix}:{local_name}" if prefix else local_name
+
+
+def iter_oai_records(source):
+    """Stream the records of an OAI-PMH ListRecords response or dump, one at a time.
+
+    The document is parsed incrementally and each record is discarded once it has been yielded, so
+    memory use does not grow with the size of the document. Deleted records, which carry no metadata,
+    are skipped.
+
+    Parameters:
+    source (str or file object): Path to the XML file, or a binary file object such as an HTTP response.
+
+    Yields:
+    dict: Fields of a record, keyed by prefixed name: 'oai:identifier', 'oai:datestamp' and 'oai:setSpec'
+        from the header, and every Dublin Core element of the metadata, e.g. 'dc:title' or 'dcterms:spatial'.
+        Repeated elements are joined with '; '.
+
+    """
+    yield from iter_oai_page(source)
+
+
+def iter_oai_page(source):
+    """Stream the records of an OAI-PMH document, then return its resumption token and error, if any.
+
+    Parameters:
+    source (str or file object): Path to the XML file, or a binary file object (see iter_oai_records).
+
+    Returns:
+    tuple: The resumptionToken (None on the last page) and the (code, message) of an OAI-PMH error element, or None.
+
+    """
+    oai = '{http://www.openarchives.org/OAI/2.0/}'
+    container = None
+    resumption_token = error = None
+    for event, element in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if container is None and element.tag == oai + 'ListRecords':
+                container = element
+            continue
+        if element.tag == oai + 'resumptionToken':
+            resumption_token = (element.text or '').strip() or None
+        elif element.tag == oai + 'error':
+            error = (element.get('code'), (element.text or '').strip())
+        if element.tag != oai + 'record':
+            continue
+        header = element.find('{http://www.openarchives.org/OAI/2.0/}header')
+        metadata = element.find('{http://www.openarchives.org/OAI/2.0/}metadata')
+        if header is not None and header.get('status') != 'deleted' and metadata is not None:
+            record = {}
+            for field in header:
+                record[_field_name(field.tag)] = (field.text or '').strip()
+            # The metadata holds one container element, such as qdc:qualifieddc or oai_dc:dc
+            for field in (child for wrapper in metadata for child in wrapper):
+                text = (field.text or '').strip()
+                if text:
+                    name = _field_name(field.tag)
+                    record[name] = f"{record[name]}; {text}" if name in record else text
+            yield record
+        element.clear()
+        if container is not None:
+            container.clear()  # Drop the processed records, which are its only children so far
+    return resumption_token, error
+
+
+def normalize_text(text, fold_accents=False):
+    """Normalize text for matching: NFKC normalization and case folding, and optionally accent folding.
+
+    ASCII text is only lowercased. Other text is normalized one base character and its combining marks
+    at a time, as in normalize_spans; the result is memoized for each distinct value.
+
+    Parameters:
+    text (str): Text to normalize.
+    fold_accents (bool): True to also remove accents and other combining marks, so 'chō' matches 'cho'.
+
+    Returns:
+    str: The normalized text.
+
+    """
+    if text.isascii():
+        return text.lower()
+    return _normalize_unicode(text, fold_accents)
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def _normalize_unicode(text, fold_accents):
+    """Normalize non-ASCII text; see normalize_text."""
+    return ''.join(part for part, start, end in _normalized_parts(text, fold_accents))
+
+
+def normalize_spans(text, fold_accents=False):
+    """Normalize text as normalize_text does, keeping track of where each normalized character came from.
+
+    Unlike normalize_text, the result is not memoized, as the offsets take far more memory than the text.
+
+    Parameters:
+    text (str): Text to normalize.
+    fold_accents (bool): True to also remove accents and other combining marks.
+
+    Returns:
+    tuple: The normalized text, and for each of its characters the (start, end) offsets in the original
+    text of the characters it came from, or None if each character maps to the character at the same offset.
+
+    """
+    if text.isascii():
+        return text.lower(), None
+    parts, spans = [], []
+    for part, start, end in _normalized_parts(text, fold_accents):
+        parts.append(part)
+        spans.extend([(start, end)] * len(part))
+    normalized = ''.join(parts)
+    if len(spans) == len(text) and all(start == offset for offset, (start, end) in enumerate(spans)):
+        return normalized, None
+    return normalized, spans
+
+
+def _normalized_parts(text, fold_accents):
+    """Yield the normalized form of each base character and its combining marks, with their (start, end) offsets."""
+    position = 0
+    while position < len(text):
+        end = position + 1
+        while end < len(text) and unicodedata.combining(text[end]):
+            end += 1
+        part = unicodedata.normalize('NFKC', text[position:end]).casefold()
+        if fold_accents:
+            part = ''.join(char for char in unicodedata.normalize('NFD', part) if not unicodedata.combining(char))
+        yield part, position, end
+        position = end
+
+
+def term_variants(term):
+    """Return the singular and plural forms of a lexicon term, made by inflecting its last word.
+
+    Regular English suffix rules are applied in both directions ('city' and 'cities', 'church' and
+    'churches', 'aborigines' and 'aborigine'), along with the irregular forms of IRREGULAR_PLURALS.
+    Both rules are applied where a word could follow either, so some variants are not real words;
+    they are harmless, as they only match text that contains them.
+
+    Parameters:
+    term (str): A lexicon term.
+
+    Returns:
+    list of str: The lowercased variants, without the term itself.
+
+    """
+    key = term.lower()
+    head, space, last = key.rpartition(' ')
+    if len(last) < 3 or not last.isalpha():
+        return []
+
+    forms = set()
+    for singular, plural in IRREGULAR_PLURALS.items():
+        compound = singular in IRREGULAR_SUFFIXES
+        if last == singular or (compound and last.endswith(singular)):
+            forms.add(last[:-len(singular)] + plural)
+        if last == plural or (compound and last.endswith(plural)):
+            forms.add(last[:-len(plural)] + singular)
+
+    if last.endswith('ies'):
+        forms.add(last[:-3] + 'y')
+    elif last.endswith(('ses', 'xes', 'zes', 'ches', 'shes', 'oes')):
+        forms.update((last[:-2], last[:-1]))
+    elif last.endswith('s') and not last.endswith(('ss', 'us', 'is')):
+        forms.add(last[:-1])
+    elif last.endswith('y') and last[-2] not in 'aeiou':
+        forms.add(last[:-1] + 'ies')
+    elif last.endswith(('s', 'x', 'z', 'ch', 'sh')):
+        forms.add(last + 'es')
+    elif last.endswith('o'):
+        forms.update((last + 's', last + 'es'))
+    else:
+        forms.add(last + 's')
+    return sorted(head + space + form for form in forms if form != last)
+
+
+def lexicon_keys(terms, variants=False, fold_accents=False):
+    """Return the normalized forms matched for each lexicon term.
+
+    Parameters:
+    terms (list of str): Lexicon terms, in lexicon order.
+    variants (bool): True to also match the singular and plural forms of each term. A variant that is
+        itself one of the terms is left to that term, so that each form reports a single term.
+    fold_accents (bool): True to remove accents from the terms; see normalize_text.
+
+    Returns:
+    list of list of str: The forms of each term, starting with the term itself; empty for terms that
+    are not strings.
+
+    """
+    normalized = [normalize_text(term, fold_accents) if isinstance(term, str) and term else None for term in terms]
+    exact = {key for key in normalized if key}
+    keys = []
+    for key in normalized:
+        if not key:
+            keys.append([])
+        elif variants:
+            keys.append([key] + [form for form in term_variants(key) if form not in exact])
+        else:
+            keys.append([key])
+    return keys
+
+
+def word_pattern(keys):
+    """Return a regular expression matching any of the given forms as a whole word."""
+    if len(keys) == 1:
+        return r'\b' + re.escape(keys[0]) + r'\b'
+    return r'\b(?:' + '|'.join(re.escape(key) for key in keys) + r')\b'
+
+
+class LexiconMatcher:
+    """An Aho-Corasick automaton that finds every lexicon term in a text in a single scan.
+
+    Terms are matched on whole words only, in text and terms normalized by normalize_text, following the
+    same rules as re.search(r'\\b' + re.escape(term) + r'\\b', text) on the normalized text. Variants of a term are
+    inserted as further keys of the same term, so they are found in the same scan and reported
+    as the lexicon term.
+
+    """
+
+    def __init__(self, terms, variants=False, fold_accents=False):
+        """Compile the lexicon terms into the automaton.
+
+        Parameters:
+        terms (list of str): Lexicon terms, in lexicon order. Terms that are not strings are ignored.
+        variants (bool): True to also match the singular and plural forms of each term.
+        fold_accents (bool): True to match terms and text with their accents removed.
+
+        """
+        self.terms = list(terms)
+        self.fold_accents = fold_accents
+        self._goto = [{}]  # Transitions out of each node, keyed by character
+        self._fail = [0]  # Failure link of each node
+        self._output = [[]]  # (term index, term length) pairs that end at each node
+
+        for index, keys in enumerate(lexicon_keys(self.terms, variants, fold_accents)):
+            for key in keys:
+                node = 0
+                for char in key:
+                    child = self._goto[node].get(char)
+                    if child is None:
+                        child = len(self._goto)
+                        self._goto.append({})
+                        self._fail.append(0)
+                        self._output.append([])
+                        self._goto[node][char] = child
+                    node = child
+                self._output[node].append((index, len(key)))
+
+        # Breadth-first pass to link every node to its longest proper suffix in the trie
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def scan(self, text):
+        """Scan normalized text once and yield every whole-word occurrence of a lexicon term.
+
+        Parameters:
+        text (str): Text normalized by normalize_text.
+
+        Yields:
+        tuple: (term index, start offset, end offset) for each occurrence.
+
+        """
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                end = position + 1
+                for index, length in output[node]:
+                    start = end - length
+                    if _is_word_boundary(text, start) and _is_word_boundary(text, end):
+                        yield index, start, end
+
+    def find_terms(self, text):
+        """Find the lexicon terms that occur in the text.
+
+        Parameters:
+        text (str): Text to search.
+
+        Returns:
+        list of int: Indexes of the matched terms, in lexicon order, each reported once.
+
+        """
+        return sorted({index for index, start, end in self.scan(normalize_text(text, self.fold_accents))})
+
+    def count_terms(self, text):
+        """Count the occurrences of the lexicon terms in the text.
+
+        Occurrences of the same term are counted without overlaps, as re.findall would find them.
+
+        Parameters:
+        text (str): Text to search.
+
+        Returns:
+        list of tuple: (term index, number of occurrences) of the matched terms, in lexicon order.
+
+        """
+        counts, ends = {}, {}
+        for index, start, end in self.scan(normalize_text(text, self.fold_accents)):
+            if start >= ends.get(index, 0):
+                counts[index] = counts.get(index, 0) + 1
+                ends[index] = end
+        return sorted(counts.items())
+
+    def find_spans(self, text):
+        """Find the lexicon terms that occur in the text, where each first occurs and how often.
+
+        Parameters:
+        text (str): Text to search.
+
+        Returns:
+        list of tuple: (term index, start offset, end offset, occurrences) of each matched term, in lexicon
+        order. The offsets are those of the first occurrence in the text as given, with the end offset
+        exclusive. Occurrences of the same term are counted without overlaps, as re.findall would find them.
+
+        """
+        normalized, spans = normalize_spans(text, self.fold_accents)
+        first, counts, ends = {}, {}, {}
+        for index, start, end in self.scan(normalized):
+            if index not in first:
+                first[index] = (start, end)
+            if start >= ends.get(index, 0):
+                counts[index] = counts.get(index, 0) + 1
+                ends[index] = end
+        if spans is not None:
+            # Normalization changed the length of the text (e.g. 'ß' to 'ss'), so map the offsets back to the original text
+            return [(index, spans[start][0], spans[end - 1][1], counts[index]) for index, (start, end) in sorted(first.items())]
+        return [(index, start, end, counts[index]) for index, (start, end) in sorted(first.items())]
+
+
+def fan_out(codes, unique_positions):
+    """Map positions of distinct values back to every row position that carries them.
+
+    Parameters:
+    codes (numpy.ndarray): Code of the distinct value at each row position, as returned by pandas.factorize.
+    unique_positions (numpy.ndarray): Positions of distinct values, for example one per match.
+
+    Returns:
+    tuple of numpy.ndarray: Row positions, and for each of them the index into unique_positions it came from.
+
+    """
+    order = np.argsort(codes, kind='stable')  # Row positions grouped by distinct value
+    counts = np.bincount(codes, minlength=int(codes.max()) + 1 if len(codes) else 0)
+    starts = np.cumsum(counts) - counts
+    repeats = counts[unique_positions]
+    sources = np.repeat(np.arange(len(unique_positions)), repeats)
+    ranks = np.arange(repeats.sum()) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    return order[starts[unique_positions][sources] + ranks], sources
+
+
+def match_columns(frame, selected_columns, match_values, offset=0, profiler=None):
+    """Match the selected columns of a metadata frame column by column, each distinct cell value once.
+
+    Metadata is repetitive, so the text cells of a column are factorized, their distinct values are
+    matched, and the matches are fanned out to every row carrying the value.
+
+    Parameters:
+    frame (pandas.DataFrame): Metadata rows to match.
+    selected_columns (list of str): Columns to match, in output order.
+    match_values (callable): Called with the distinct text values of a column; returns an array of the
+        position of the value of each match, followed by arrays with one item per match, such as term indexes.
+    offset (int): Position of the first row of the frame within the full metadata.
+    profiler (Profiler): Records the time spent factorizing and matching each column, if given.
+
+    Returns:
+    tuple of numpy.ndarray: Row positions and selected column positions of the matches, followed by
+    the arrays returned by match_values for every row.
+
+    """
+    rows, cols, fields = [], [], []
+    for col_position, col in enumerate(selected_columns):
+        with profiler.stage('factorize') if profiler else nullcontext():
+            text_rows, codes, uniques = factorize_text(frame[col])
+        start = time.perf_counter()
+        unique_positions, *unique_fields = match_values(uniques)
+        if profiler:
+            profiler.add(profiler.columns, col, time.perf_counter() - start, len(uniques))
+        positions, sources = fan_out(codes, unique_positions)
+        rows.append(text_rows[positions] + offset)
+        cols.append(np.full(len(positions), col_position, dtype=np.int64))
+        fields.append([values[sources] for values in unique_fields])
+    if not rows:
+        empty = np.empty(0, dtype=np.int64)
+        return (empty, empty) + tuple(match_values(pd.Series([], dtype=object)))[1:]
+    return (np.concatenate(rows), np.concatenate(cols)) + tuple(np.concatenate(parts) for parts in zip(*fields))
+
+
+_worker_state = None  # Frame matching function and compiled lexicon received by a worker process when it starts
+
+
+def init_worker(match_frame, matcher):
+    """Store the frame matching function and the compiled lexicon shipped to a worker process.
+
+    Parameters:
+    match_frame (callable): The front end's function that matches a frame of metadata, called as
+        match_frame(frame, selected_columns, matcher, offset, **options).
+    matcher: Compiled lexicon passed to match_frame.
+
+    """
+    global _worker_state
+    _worker_state = (match_frame, matcher)
+
+
+def match_shard(frame, selected_columns, offset, options):
+    """Match one shard of metadata rows inside a worker process.
+
+    Parameters:
+    frame (pandas.DataFrame): Rows of the shard.
+    selected_columns (list of str): Columns to match.
+    offset (int): Position of the first row of the shard within the full metadata.
+    options (dict): Further keyword arguments of the match_frame function given to init_worker.
+
+    """
+    match_frame, matcher = _worker_state
+    return match_frame(frame, selected_columns, matcher, offset, **options)
+
+
+class Profiler:
+    """Records wall time and call counts of the pipeline stages, metadata columns and lexicon terms of a run."""
+
+    def __init__(self):
+        """Start with empty timing tables."""
+        self.stages = {}  # Stage name -> [seconds, calls]
+        self.columns = {}  # Metadata column -> [seconds, distinct values matched]
+        self.terms = {}  # (term, category) -> [seconds, calls], for engines that match term by term
+        self.matches = {}  # (term, category) -> number of matches
+
+    @contextmanager
+    def stage(self, name):
+        """Time a pipeline stage; repeated stages accumulate."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(self.stages, name, time.perf_counter() - start)
+
+    def add(self, table, key, seconds, calls=1):
+        """Add wall time and calls to an entry of one of the timing tables."""
+        entry = table.setdefault(key, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += calls
+
+    def count_matches(self, terms, categories, term_ids):
+        """Count matches per lexicon term from an array of matched term indexes."""
+        for term_index, count in enumerate(np.bincount(term_ids, minlength=len(terms)).tolist()):
+            if count:
+                key = (terms[term_index], categories[term_index])
+                self.matches[key] = self.matches.get(key, 0) + count
+
+    def report(self, slowest=20):
+        """Summarize the run.
+
+        Parameters:
+        slowest (int): Number of slowest terms to include.
+
+        Returns:
+        dict: Stages, columns, categories and slowest terms, each sorted by decreasing wall time. Categories
+        are only timed by engines that match term by term; otherwise they have their matches alone,
+        sorted by decreasing matches.
+
+        """
+        timed = bool(self.terms)
+        categories = {}
+        for (term, category), (seconds, calls) in self.terms.items():
+            entry = categories.setdefault(category, {'category': category, 'seconds': 0.0, 'calls': 0, 'matches': 0})
+            entry['seconds'] += seconds
+            entry['calls'] += calls
+        for (term, category), count in self.matches.items():
+            entry = categories.setdefault(category, {'category': category, 'seconds': 0.0, 'calls': 0, 'matches': 0}
+                                          if timed else {'category': category, 'matches': 0})
+            entry['matches'] += count
+
+        def rows(table, name):
+            return sorted(({name: key, 'seconds': round(seconds, 6), 'calls': calls} for key, (seconds, calls) in table.items()),
+                          key=lambda row: -row['seconds'])
+
+        terms = sorted(({'term': term, 'category': category, 'seconds': round(seconds, 6), 'calls': calls,
+                         'matches': self.matches.get((term, category), 0)}
+                        for (term, category), (seconds, calls) in self.terms.items()), key=lambda row: -row['seconds'])
+        return {
+            'stages': rows(self.stages, 'stage'),
+            'columns': rows(self.columns, 'column'),
+            'categories': sorted(({**entry, 'seconds': round(entry['seconds'], 6)} if timed else entry for entry in categories.values()),
+                                 key=lambda row: (-row.get('seconds', 0.0), -row['matches'])),
+            'slowest_terms': terms[:slowest],
+        }
+
+    def format_text(self, report=None):
+        """Format a report as plain text tables."""
+        report = report or self.report()
+        lines = []
+        for section, name, extra in (('stages', 'stage', None), ('columns', 'column', None),
+                                     ('categories', 'category', 'matches'), ('slowest_terms', 'term', 'matches')):
+            lines.append(section.replace('_', ' ').capitalize() + ':')
+            if not report[section]:
+                lines.append("  (not measured by this matching engine)" if section == 'slowest_terms' else "  (none)")
+            for row in report[section]:
+                if 'seconds' in row:
+                    line = f"  {str(row[name])[:50]:<50} {row['seconds']:>12.4f} s {row['calls']:>10} calls"
+                else:
+                    line = f"  {str(row[name])[:50]:<50} {'(not timed)':>14} {'':>16}"
+                if extra:
+                    line += f" {row[extra]:>10} {extra}"
+                lines.append(line)
+            lines.append('')
+        return '\n'.join(lines)
+
+
+def dictionary_codes(values):
+    """Dictionary-encode a list of values, returning an integer code per value and the distinct values."""
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    return codes.astype(np.int64), list(uniques)
@@ -0,0 +1,334 @@
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+CODE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMMAND_LINE_TOOL = os.path.join(CODE_DIR, 'MarMAT-CommandLine-2.6.py')
+LEXICON = os.path.join(CODE_DIR, 'lexicon-reparative-metadata.csv')
+LCSH_LEXICON = os.path.join(CODE_DIR, 'lexicon-LCSH.csv')
+METADATA = os.path.join(CODE_DIR, 'example-input-metadata.csv')
+COLUMNS = ['title', 'description', 'subjects']
+
+
+def load_command_line_tool():
+    """Import the MaRMAT command-line tool as a module."""
+    sys.path.insert(0, CODE_DIR)
+    spec = importlib.util.spec_from_file_location('marmat', COMMAND_LINE_TOOL)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['marmat'] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+marmat = load_command_line_tool()
+import marmat_engine  # noqa: E402  (on sys.path once the tool is loaded)
+
+
+def run_tool(lexicon_path, metadata_path, output_file, **options):
+    """Run the tool with the given attributes set and return the number of matches and the printed log."""
+    tool = marmat.MaRMAT()
+    for name, value in options.items():
+        setattr(tool, name, value)
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        tool.load_lexicon(lexicon_path)
+        tool.load_metadata(metadata_path)
+        tool.select_columns(COLUMNS)
+        tool.select_identifier_column('id')
+        tool.select_categories(tool.lexicon_df['category'].dropna().unique().tolist())
+        match_count = tool.perform_matching(output_file)
+    return match_count, log.getvalue()
+
+
+@pytest.mark.parametrize('mode', ['incremental', 'lexicon_delta'])
+def test_summary_of_repeated_run_with_counts(tmp_path, mode):
+    """A second incremental or lexicon delta run carries over Count from the CSV output and summarizes it."""
+    metadata_df = pd.read_csv(METADATA)
+    lexicon_df = pd.read_csv(LEXICON)
+    first_metadata, second_metadata = tmp_path / 'metadata-1.csv', tmp_path / 'metadata-2.csv'
+    first_lexicon, second_lexicon = tmp_path / 'lexicon-1.csv', tmp_path / 'lexicon-2.csv'
+    metadata_df.to_csv(first_metadata, index=False)
+    metadata_df.assign(title=metadata_df['title'].where(metadata_df.index % 7 != 0, 'Indian chief')).to_csv(second_metadata, index=False)
+    lexicon_df.iloc[10:].to_csv(first_lexicon, index=False)
+    lexicon_df.to_csv(second_lexicon, index=False)
+    if mode == 'incremental':
+        runs = [(first_lexicon, first_metadata), (first_lexicon, second_metadata)]
+    else:
+        runs = [(first_lexicon, first_metadata), (second_lexicon, first_metadata)]
+
+    options = {'summary_format': 'json', 'count_occurrences': True}
+    output_file = str(tmp_path / 'matches.csv')
+    for lexicon_path, metadata_path in runs:
+        match_count, log = run_tool(lexicon_path, metadata_path, output_file, **options, **{mode: True})
+        assert match_count is not None, log
+    full_file = str(tmp_path / 'full.csv')
+    run_tool(lexicon_path, metadata_path, full_file, **options)
+
+    with open(output_file + '.summary.json', encoding='utf-8') as summary_file:
+        summary = json.load(summary_file)
+    with open(full_file + '.summary.json', encoding='utf-8') as summary_file:
+        assert summary == json.load(summary_file)
+    assert summary['occurrences'] == pd.read_csv(output_file)['Count'].sum()
+
+
+@pytest.mark.parametrize('variants', [False, True])
+@pytest.mark.parametrize('listings', [(1, 2), (2, 1), (1, 3), (3, 2)])
+def test_lexicon_delta_with_repeated_terms(tmp_path, listings, variants):
+    """A lexicon delta run writes the output of a full run when terms are listed several times in the lexicon."""
+    lexicon_df = pd.read_csv(LEXICON).drop_duplicates()
+    repeated = lexicon_df[lexicon_df['term'].isin(['relocation', 'indian', 'wife'])]
+    lexicon_paths = []
+    for run, count in enumerate(listings):
+        lexicon_paths.append(tmp_path / f'lexicon-{run}.csv')
+        pd.concat([lexicon_df] + [repeated] * (count - 1), ignore_index=True).to_csv(lexicon_paths[-1], index=False)
+
+    output_file = str(tmp_path / 'matches.csv')
+    for lexicon_path in lexicon_paths:
+        match_count, log = run_tool(lexicon_path, METADATA, output_file, lexicon_delta=True, variants=variants)
+        assert match_count is not None, log
+    full_file = str(tmp_path / 'full.csv')
+    full_count, log = run_tool(lexicon_paths[-1], METADATA, full_file, variants=variants)
+    assert match_count == full_count
+    with open(output_file, encoding='utf-8') as output, open(full_file, encoding='utf-8') as full_output:
+        assert output.read() == full_output.read()
+
+
+@pytest.mark.parametrize('output_format', ['parquet', 'arrow'])
+def test_streaming_output_with_mixed_identifier_types(tmp_path, output_format):
+    """Chunks whose identifiers are read as numbers and later chunks with text identifiers share one schema."""
+    pytest.importorskip('pyarrow')
+    metadata_df = pd.read_csv(METADATA)
+    metadata_df['id'] = [str(position) if position < 15 else f'ark:{position}' for position in range(len(metadata_df))]
+    metadata_path = tmp_path / 'metadata.csv'
+    metadata_df.to_csv(metadata_path, index=False)
+
+    csv_count, log = run_tool(LEXICON, metadata_path, str(tmp_path / 'matches.csv'), chunk_size=10)
+    output_file = str(tmp_path / f'matches.{output_format}')
+    match_count, log = run_tool(LEXICON, metadata_path, output_file, chunk_size=10, output_format=output_format)
+    assert match_count == csv_count, log
+    matches_df = marmat.read_matches(output_file, output_format)
+    expected_df = marmat.read_matches(str(tmp_path / 'matches.csv'))
+    assert matches_df.astype(str).equals(expected_df)
+
+
+@pytest.mark.parametrize('chunk_size', [None, 100])
+def test_oai_columns_not_in_records(tmp_path, chunk_size):
+    """Columns found in none of the records of an OAI-PMH document are reported as for a CSV file."""
+    oai_file = os.path.join(os.path.dirname(CODE_DIR), 'XML Test Code', 'Sample Data', 'oai_uum_map.xml')
+    tool = marmat.MaRMAT()
+    tool.chunk_size = chunk_size
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        tool.load_lexicon(LEXICON)
+        tool.load_metadata(oai_file)
+        tool.select_columns(['dc:title', 'title'])
+        tool.select_identifier_column('oai:identifier')
+        tool.select_categories(['Race'])
+        match_count = tool.perform_matching(str(tmp_path / 'matches.csv'))
+    assert match_count is None
+    assert "columns expected but not found: ['title']" in log.getvalue()
+
+
+@pytest.mark.parametrize('chunk_size', [None, 1000])
+def test_latin1_bytes_past_encoding_sample(tmp_path, monkeypatch, chunk_size):
+    """A file that is only Latin-1 after the sample its encoding is detected from is matched as Latin-1."""
+    monkeypatch.setattr(marmat_engine, 'CATEGORY_SAMPLE_ROWS', 100)  # Leave the Latin-1 row to the full or chunked read
+    metadata_df = pd.read_csv(METADATA).map(lambda value: value.encode('ascii', 'replace').decode() if isinstance(value, str) else value)
+    copies = 1024 * 1024 // len(metadata_df.to_csv(index=False).encode('utf-8')) + 2
+    metadata_df = pd.concat([metadata_df] * copies, ignore_index=True)
+    metadata_df['id'] = range(len(metadata_df))
+    metadata_df.loc[len(metadata_df) - 1, 'title'] = 'Café of the Indians'
+    latin1_path, utf8_path = tmp_path / 'metadata-latin1.csv', tmp_path / 'metadata-utf8.csv'
+    metadata_df.to_csv(latin1_path, index=False, encoding='latin1')
+    metadata_df.to_csv(utf8_path, index=False, encoding='utf-8')
+
+    match_count, log = run_tool(LEXICON, latin1_path, str(tmp_path / 'latin1.csv'), chunk_size=chunk_size)
+    assert match_count is not None, log
+    assert ('matching it again as Latin-1' in log) == bool(chunk_size)
+    run_tool(LEXICON, utf8_path, str(tmp_path / 'utf8.csv'), chunk_size=chunk_size)
+    assert pd.read_csv(tmp_path / 'latin1.csv').equals(pd.read_csv(tmp_path / 'utf8.csv'))
+
+
+def test_batch_status_of_failed_files(tmp_path):
+    """The batch summary reports the error that stopped each failed file, and only failed files."""
+    metadata_df = pd.read_csv(METADATA)
+    metadata_df.to_csv(tmp_path / 'good.csv', index=False)
+    metadata_df.drop(columns='subjects').to_csv(tmp_path / 'no-subjects.csv', index=False)
+    (tmp_path / 'errors.csv').write_text('id,title,description,subjects\n1,"Error report",Please see,\n', encoding='utf-8')
+    tool = marmat.MaRMAT()
+    with contextlib.redirect_stdout(io.StringIO()):
+        tool.load_lexicon(LEXICON)
+        tool.select_columns(COLUMNS)
+        tool.select_identifier_column('id')
+        tool.select_categories(tool.lexicon_df['category'].dropna().unique().tolist())
+        paths = [str(tmp_path / name) for name in ('good.csv', 'no-subjects.csv', 'errors.csv', 'missing.csv')]
+        summary_df = tool.perform_batch_matching(paths, str(tmp_path / 'results'))
+    status = dict(zip(summary_df['File'].map(os.path.basename), summary_df['Status']))
+    assert status['good.csv'] == 'ok' and status['errors.csv'] == 'ok'
+    assert status['no-subjects.csv'].startswith('An error occurred while loading metadata') and 'subjects' in status['no-subjects.csv']
+    assert status['missing.csv'].startswith('An error occurred while loading metadata') and 'missing.csv' in status['missing.csv']
+
+
+@pytest.mark.parametrize('engine', ['automaton', 'regex'])
+def test_profile_times_categories_only_when_measured(tmp_path, engine):
+    """Categories are timed by the engines that match term by term, and only counted by the others."""
+    output_file = str(tmp_path / 'matches.csv')
+    profiler = marmat.Profiler()
+    match_count, log = run_tool(LEXICON, METADATA, output_file, engine=engine, profiler=profiler)
+    assert match_count, log
+    categories = profiler.report()['categories']
+    assert sum(row['matches'] for row in categories) == match_count
+    assert all(('seconds' in row) == (engine == 'regex') for row in categories)
+
+
+def read_output(path):
+    """Return the content of an output CSV file."""
+    with open(path, encoding='utf-8') as output:
+        return output.read()
+
+
+@pytest.mark.parametrize('lexicon_path', [LEXICON, LCSH_LEXICON])
+@pytest.mark.parametrize('options', [{}, {'variants': True}, {'fold_accents': True}, {'count_occurrences': True}])
+def test_engines_find_the_same_matches(tmp_path, lexicon_path, options):
+    """The automaton, vectorized and regex engines write the same output."""
+    outputs = {}
+    for engine in ('automaton', 'vectorized', 'regex'):
+        output_file = str(tmp_path / f'{engine}.csv')
+        match_count, log = run_tool(lexicon_path, METADATA, output_file, engine=engine, **options)
+        assert match_count, log
+        outputs[engine] = read_output(output_file)
+    assert outputs['automaton'] == outputs['vectorized'] == outputs['regex']
+
+
+@pytest.mark.parametrize('options', [{'chunk_size': 7}, {'workers': 2}, {'chunk_size': 50, 'workers': 2},
+                                     {'chunk_size': 7, 'count_occurrences': True}, {'engine': 'regex', 'chunk_size': 7}])
+def test_chunked_and_parallel_output_matches_serial(tmp_path, options):
+    """Streaming the metadata in chunks or sharding it across workers writes the output of a serial run."""
+    metadata_df = pd.read_csv(METADATA)
+    metadata_df = pd.concat([metadata_df.assign(id=metadata_df['id'] + copy) for copy in range(10)], ignore_index=True)
+    metadata_path = tmp_path / 'metadata.csv'
+    metadata_df.to_csv(metadata_path, index=False)
+    serial_options = {name: value for name, value in options.items() if name in ('engine', 'count_occurrences')}
+    serial_count, log = run_tool(LEXICON, metadata_path, str(tmp_path / 'serial.csv'), **serial_options)
+    assert serial_count, log
+    match_count, log = run_tool(LEXICON, metadata_path, str(tmp_path / 'matches.csv'), **options)
+    assert match_count == serial_count, log
+    assert read_output(tmp_path / 'matches.csv') == read_output(tmp_path / 'serial.csv')
+
+
+@pytest.mark.parametrize('engine', ['automaton', 'regex'])
+def test_incremental_run_matches_full_run(tmp_path, engine):
+    """An incremental run over changed records, some of which share an identifier, writes the output of a full run."""
+    metadata_df = pd.read_csv(METADATA)
+    assert metadata_df['id'].duplicated().any()
+    first_metadata, second_metadata = tmp_path / 'metadata-1.csv', tmp_path / 'metadata-2.csv'
+    metadata_df.to_csv(first_metadata, index=False)
+    changed_df = metadata_df.assign(title=metadata_df['title'].where(metadata_df.index % 5 != 0, 'Indian chief and his wife'))
+    changed_df.drop(index=[3, 20]).to_csv(second_metadata, index=False)
+
+    output_file = str(tmp_path / 'matches.csv')
+    for metadata_path in (first_metadata, second_metadata):
+        match_count, log = run_tool(LEXICON, metadata_path, output_file, engine=engine, incremental=True)
+        assert match_count is not None, log
+    assert 'records unchanged' in log
+    full_count, log = run_tool(LEXICON, second_metadata, str(tmp_path / 'full.csv'), engine=engine)
+    assert match_count == full_count
+    assert read_output(output_file) == read_output(tmp_path / 'full.csv')
+
+
+@pytest.mark.parametrize('variants', [False, True])
+def test_lexicon_delta_run_matches_full_run(tmp_path, variants):
+    """A lexicon delta run after terms were added and removed writes the output of a full run."""
+    lexicon_df = pd.read_csv(LEXICON)
+    first_lexicon, second_lexicon = tmp_path / 'lexicon-1.csv', tmp_path / 'lexicon-2.csv'
+    lexicon_df.iloc[20:].to_csv(first_lexicon, index=False)
+    lexicon_df[~lexicon_df['term'].isin(['indians', 'wife'])].to_csv(second_lexicon, index=False)
+
+    output_file = str(tmp_path / 'matches.csv')
+    for lexicon_path in (first_lexicon, second_lexicon):
+        match_count, log = run_tool(lexicon_path, METADATA, output_file, lexicon_delta=True, variants=variants)
+        assert match_count is not None, log
+    assert '20 terms added and 2 terms removed' in log
+    full_count, log = run_tool(second_lexicon, METADATA, str(tmp_path / 'full.csv'), variants=variants)
+    assert match_count == full_count
+    assert read_output(output_file) == read_output(tmp_path / 'full.csv')
+
+
+def test_lexicon_cache_invalidation(tmp_path, monkeypatch):
+    """Cached lexicons are reused for the same lexicon and version, and rebuilt when either changes."""
+    cache_dir = tmp_path / 'cache'
+    lexicon_path = tmp_path / 'lexicon.csv'
+    lexicon_df = pd.read_csv(LEXICON)
+    lexicon_df.to_csv(lexicon_path, index=False)
+
+    def compile_lexicon():
+        tool = marmat.MaRMAT()
+        with contextlib.redirect_stdout(io.StringIO()):
+            tool.load_lexicon(str(lexicon_path))
+            tool.select_cache(str(cache_dir))
+        return tool.compile_lexicon(tool.lexicon_df['category'].unique().tolist())
+
+    def entries():
+        return sorted(name for name in os.listdir(cache_dir) if name.endswith('.pickle'))
+
+    compile_lexicon()
+    first_entries = entries()
+    assert len(first_entries) == 1
+    compile_lexicon()
+    assert entries() == first_entries
+
+    monkeypatch.setattr(marmat, 'LEXICON_CACHE_VERSION', marmat.LEXICON_CACHE_VERSION + 1)
+    compile_lexicon()
+    assert len(entries()) == 2
+
+    pd.concat([lexicon_df, pd.DataFrame({'term': ['trailblazer'], 'category': ['Aggrandizement']})]).to_csv(lexicon_path, index=False)
+    compiled = compile_lexicon()
+    assert len(entries()) == 3
+    assert 'trailblazer' in compiled.terms
+
+
+def test_lexicon_cache_evicts_least_recently_used(tmp_path):
+    """Once the cache is full, the entry used longest ago is evicted, and reading an entry counts as a use."""
+    cache = marmat.LexiconCache(str(tmp_path / 'cache'))
+    lexicons = [marmat.CompiledLexicon([term], ['Race']) for term in ('indian', 'savage', 'squaw')]
+    keys = [cache.key(f'lexicon-{position}', ['Race'], {}) for position in range(len(lexicons))]
+    for age, (key, compiled) in enumerate(zip(keys[:2], lexicons[:2])):
+        cache.put(key, compiled)
+        path = os.path.join(cache.directory, key + '.pickle')
+        os.utime(path, (1000 + age, 1000 + age))
+    cache.max_bytes = sum(os.path.getsize(os.path.join(cache.directory, key + '.pickle')) for key in keys[:2])
+    assert cache.get(keys[0]).terms == ['indian']  # Now the most recently used
+    cache.put(keys[2], lexicons[2])
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None and cache.get(keys[2]) is not None
+
+
+@pytest.mark.parametrize('match, subject, expected', [
+    ('exact', 'Indians of North America', ['Indians of North America']),
+    ('exact', 'Indians of North America--Monuments--Utah', []),
+    ('broader', 'Indians of North America--Monuments--Utah', ['Indians of North America', 'Indians of North America--Monuments']),
+    ('broader', 'indians of north america.', ['Indians of North America']),
+    ('broader', 'World War, 1939-1945--Campaigns--France', []),
+    ('heading', 'World War, 1939-1945--Campaigns--France', ['World War, 1939-1945--Gays']),
+    ('heading', 'Indians of North America', ['Indians of North America', 'Indians of North America--Monuments']),
+    ('heading', 'Indians of South America', []),
+])
+def test_heading_trie_match_modes(match, subject, expected):
+    """The lcsh engine matches the same heading, its broader headings, or any heading with the same main heading."""
+    headings = ['World War, 1939-1945--Gays', 'Indians of North America', 'Indians of North America--Monuments']
+    trie = marmat.HeadingTrie(headings, match)
+    assert sorted(headings[index] for index in trie.find_heading(subject)) == sorted(expected)
+
+
+def test_heading_trie_cells():
+    """Subject cells are split into headings, and each lexicon heading is reported once per cell."""
+    trie = marmat.HeadingTrie(['Indians of North America', 'Race relations'])
+    cell = 'Indians of North America--Utah; Race relations; Indians of North America--Pictorial works'
+    assert trie.find_terms(cell) == [0, 1]
+    assert sorted(trie.count_terms(cell)) == [(0, 2), (1, 1)]
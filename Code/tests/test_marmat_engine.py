@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from marmat_engine import LexiconMatcher, lexicon_keys, term_variants  # noqa: E402
+
+
+@pytest.mark.parametrize('term, variants', [
+    ('indian', ['indians']),
+    ('indians', ['indian']),
+    ('city', ['cities']),
+    ('cities', ['city']),
+    ('church', ['churches']),
+    ('box', ['boxes']),
+    ('negro', ['negroes', 'negros']),
+    ('native american', ['native americans']),
+    ('wife', ['wifes', 'wives']),
+    ('child', ['children', 'childs']),
+    ('chairman', ['chairmans', 'chairmen']),
+    ('Oriental', ['orientals']),
+    ('half-breed', []),
+    ('ox', []),
+])
+def test_term_variants(term, variants):
+    """Singular and plural forms are made by inflecting the last word, with irregular plurals and compounds."""
+    assert term_variants(term) == variants
+
+
+def test_variant_left_to_the_term_it_spells():
+    """A variant that is also a lexicon term is matched as that term only."""
+    assert lexicon_keys(['Indian', 'indians', 'tribe'], variants=True) == [['indian'], ['indians'], ['tribe', 'tribes']]
+    matcher = LexiconMatcher(['Indian', 'indians', 'tribe'], variants=True)
+    assert matcher.find_terms('Indians of the tribes; an Indian') == [0, 1, 2]
+    assert matcher.count_terms('tribe, tribes and tribe') == [(2, 3)]
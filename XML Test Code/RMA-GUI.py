@@ -1,15 +1,10 @@
 import xml.etree.ElementTree as ET
 import csv
-import nltk
 import string
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
 import tkinter as tk
 from tkinter import filedialog, messagebox
 
-# Download NLTK resources if not already downloaded
-nltk.download('punkt')
-nltk.download('stopwords')
+from rma_tokenizer import STOP_WORDS, word_tokenize
 
 def parse_xml_to_csv(xml_file, csv_file):
     """
@@ -33,7 +28,7 @@ def parse_xml_to_csv(xml_file, csv_file):
     }
     
     # Load stopwords and punctuation
-    stop_words = set(stopwords.words('english'))
+    stop_words = STOP_WORDS
     punctuation = set(string.punctuation)
     
     # Parse XML
@@ -0,0 +1,113 @@
+import argparse
+import os
+import random
+import re
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Sample Data', 'oai_uum_map.xml')
+
+PAGE_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+\t<responseDate>2024-03-26T15:33:47Z</responseDate>
+\t<request verb="ListRecords">{base_url}</request>
+{body}
+</OAI-PMH>
+"""
+
+def load_records(xml_file):
+    """
+    Splits an OAI-PMH ListRecords response into the raw XML of its records.
+
+    Parameters:
+    - xml_file (str): File path of the XML sample.
+
+    Returns:
+    - list of str: The <record> elements of the sample, unchanged.
+    """
+    with open(xml_file, encoding='utf-8') as file:
+        return re.findall(r'<record>.*?</record>', file.read(), flags=re.DOTALL)
+
+def split_sets(records, set_names):
+    """
+    Divides the records between the given sets, in contiguous runs of about the same size.
+    """
+    size = -(-len(records) // len(set_names))
+    return {name: records[i * size:(i + 1) * size] for i, name in enumerate(set_names)}
+
+class OAIHandler(BaseHTTPRequestHandler):
+    """
+    Answers ListRecords requests with pages of the sample records, like a small OAI-PMH endpoint.
+
+    Resumption tokens have the form 'set|offset|prefix'. Requests for an unknown set get a noRecordsMatch
+    error, and a share of the requests can be made to fail with 503 Service Unavailable to test retries.
+    """
+    sets = {}
+    page_size = 100
+    fail_rate = 0.0
+
+    def do_GET(self):
+        if random.random() < self.fail_rate:
+            self.send_response(503)
+            self.send_header('Retry-After', '1')
+            self.end_headers()
+            return
+
+        params = dict(urllib.parse.parse_qsl(urllib.parse.urlparse(self.path).query))
+        if params.get('verb') != 'ListRecords':
+            self.send_xml('\t<error code="badVerb">Only ListRecords is supported</error>')
+            return
+
+        if 'resumptionToken' in params:
+            try:
+                set_spec, offset, prefix = params['resumptionToken'].split('|')
+                offset = int(offset)
+            except ValueError:
+                self.send_xml('\t<error code="badResumptionToken">Invalid resumptionToken</error>')
+                return
+        else:
+            set_spec, offset, prefix = params.get('set', ''), 0, params.get('metadataPrefix', 'qdc')
+
+        if set_spec:
+            records = self.sets.get(set_spec, [])
+        else:
+            records = [record for set_records in self.sets.values() for record in set_records]
+        if not records:
+            self.send_xml('\t<error code="noRecordsMatch">No records match the request</error>')
+            return
+
+        page = records[offset:offset + self.page_size]
+        body = '\t<ListRecords>\n\t\t' + '\n\t\t'.join(page)
+        if offset + self.page_size < len(records):
+            token = f"{set_spec}|{offset + self.page_size}|{prefix}"
+            body += (f'\n\t\t<resumptionToken completeListSize="{len(records)}" cursor="{offset}">'
+                     f'{token}</resumptionToken>')
+        body += '\n\t</ListRecords>'
+        self.send_xml(body)
+
+    def send_xml(self, body):
+        content = PAGE_TEMPLATE.format(base_url=f"http://{self.headers['Host']}/oai", body=body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the sample XML as a local OAI-PMH endpoint for harvesting tests.")
+    parser.add_argument("--xml", default=SAMPLE_FILE, help="OAI-PMH XML file whose records are served")
+    parser.add_argument("--port", type=int, default=8000, help="port to listen on (default: 8000)")
+    parser.add_argument("--page-size", type=int, default=100, help="records per page (default: 100)")
+    parser.add_argument("--sets", nargs='+', default=['uum_map'], help="sets the records are divided between")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests answered with 503 (default: 0)")
+    args = parser.parse_args()
+
+    OAIHandler.sets = split_sets(load_records(args.xml), args.sets)
+    OAIHandler.page_size = args.page_size
+    OAIHandler.fail_rate = args.fail_rate
+    server = ThreadingHTTPServer(('localhost', args.port), OAIHandler)
+    print(f"Serving {sum(len(records) for records in OAIHandler.sets.values())} records at http://localhost:{args.port}/oai")
+    server.serve_forever()
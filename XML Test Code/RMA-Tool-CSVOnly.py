@@ -1,101 +1,108 @@
 import csv
-import nltk
 import string
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
 
-# Download NLTK resources if not already downloaded
-nltk.download('punkt')
-nltk.download('stopwords')
+from rma_tokenizer import STOP_WORDS, word_tokenize
 
 def load_lexicon_from_csv(file_path):
     """
-    Loads lexicon categories and terms from a CSV file into a dictionary.
+    Loads a lexicon CSV file into an index from each term to the lexicon categories it belongs to.
 
     Parameters:
     - file_path (str): File path of the CSV input file.
 
     Returns:
-    - lexicon (dict): Dictionary containing lexicon categories as keys and lists of terms as values.
+    - index (dict): Dictionary containing lowercased terms as keys and lists of their lexicon categories as values.
 
     Note:
-    - The CSV file should have lexicon categories as column headers and terms listed under each category.
+    - The CSV file should have 'term' and 'category' columns, like the lexicons of the main MaRMAT tool (e.g. lexicon-reparative-metadata.csv).
+    - Lexicons with lexicon categories as column headers and terms listed under each category, such as lexicons.csv, are also accepted.
+    - Terms are lowercased because tokens are lowercased before they are looked up. Only single-word terms can match a token.
     """
 
-    lexicon = {
-        "Aggrandizement": [],
-        "RaceEuphemisms": [],
-        "RaceTerms": [],
-        "SlaveryTerms": [],
-        "GenderTerms": [],
-        "LGBTQ": [],
-        "MentalIllness": [],
-        "Disability": []
-    }
-    
+    index = {}
     with open(file_path, 'r', encoding='utf-8-sig') as csv_file:
         csv_reader = csv.reader(csv_file)
-        next(csv_reader)  # Skip the header row
-        
-        for row in csv_reader:
-            for category, terms in lexicon.items():
-                terms.extend(row)  # Assuming each row contains terms for each lexicon category
-    
-    return lexicon
+        headers = [header.strip() for header in next(csv_reader)]
+        lowered = [header.lower() for header in headers]
+
+        if 'term' in lowered and 'category' in lowered:
+            term_column, category_column = lowered.index('term'), lowered.index('category')
+            pairs = ((row[term_column], row[category_column]) for row in csv_reader if len(row) > max(term_column, category_column))
+        else:
+            pairs = ((term, category) for row in csv_reader for category, term in zip(headers, row))
+
+        category_order = {}
+        for term, category in pairs:
+            category_order.setdefault(category, len(category_order))
+            term = term.strip().lower()
+            if term:
+                categories = index.setdefault(term, [])
+                if category not in categories:
+                    categories.append(category)
+
+    # List the categories of each term in lexicon order
+    for categories in index.values():
+        categories.sort(key=category_order.get)
+
+    return index
 
 def search_and_append_lexicon_category(lexicon, input_csv_file, output_csv_file):
     """
-    Searches for lexicon term matches in an input CSV file, appends lexicon categories to each row, and writes the modified data into an output CSV file.
+    Searches for lexicon term matches in an input CSV file, appends the matched terms under each lexicon category, and writes the matching rows into an output CSV file.
 
     Parameters:
-    - lexicon (dict): Dictionary containing lexicon categories as keys and lists of terms as values.
+    - lexicon (str): File path of the lexicon CSV file (see load_lexicon_from_csv).
     - input_csv_file (str): File path of the input CSV file.
     - output_csv_file (str): File path of the output CSV file.
 
     Note:
     - The input CSV file should contain columns specified for lexicon analysis.
-    - The output CSV file will have additional columns for each lexicon category, indicating the matched terms.
+    - The output CSV file will have additional columns for each lexicon category, listing the matched terms.
+    - Each token is looked up once in the term index, and rows without a match are left out as the input is read, so the output is written in a single pass.
     """
 
-    # Load lexicon
-    lexicon = load_lexicon_from_csv(lexicon)
+    # Build the term index and the lexicon categories in lexicon order
+    index = load_lexicon_from_csv(lexicon)
+    categories = list(dict.fromkeys(category for term_categories in index.values() for category in term_categories))
+
+    # Load stopwords and punctuation
+    stop_words = STOP_WORDS
+    punctuation = set(string.punctuation)
 
     # Open input CSV file for reading and output CSV file for writing
     with open(input_csv_file, 'r', newline='', encoding='utf-8') as input_csv, \
          open(output_csv_file, 'w', newline='', encoding='utf-8') as output_csv:
-        
+
         reader = csv.DictReader(input_csv)
-        fieldnames = reader.fieldnames + list(lexicon.keys())  # Add lexicon category names as additional columns
+        fieldnames = reader.fieldnames + categories  # Add lexicon category names as additional columns
         writer = csv.DictWriter(output_csv, fieldnames=fieldnames)
         writer.writeheader()
-        
+
         # Iterate over rows in the input CSV file
         for row in reader:
             # Initialize dictionary to store token matches for each lexicon category
-            token_matches = {category: [] for category in lexicon}
-            
-            # Tokenize and preprocess text from specified columns
+            token_matches = {category: [] for category in categories}
+
+            # Tokenize text from specified columns and look each token up in the term index
             for column in ["Title", "Subject", "Description", "Collection Name"]:
                 text = row[column]
                 if text:
-                    tokens = word_tokenize(text.lower())
-                    filtered_tokens = [word for word in tokens if word not in stopwords.words('english') and word not in string.punctuation and not word.isdigit() and word != '--']
-                    # Search for matches between tokens and terms in the lexicon
-                    for category, terms in lexicon.items():
-                        matches = [term for term in filtered_tokens if term in terms]
-                        token_matches[category].extend(matches)
-            
-            # Update the row with token matches for each lexicon category
-            row.update(token_matches)
-            # Write the modified row to the output CSV file
-            writer.writerow(row)
+                    for word in word_tokenize(text.lower()):
+                        if word in index and word not in stop_words and word not in punctuation and not word.isdigit() and word != '--':
+                            for category in index[word]:
+                                token_matches[category].append(word)
+
+            # Write the row only if a token matched, with the matched terms under each lexicon category
+            if any(token_matches.values()):
+                row.update({category: ', '.join(terms) for category, terms in token_matches.items()})
+                writer.writerow(row)
 
 # File paths
 lexicon_file_path = "PATH_TO_LEXICON_CSV_FILE"  # Insert path to your lexicon CSV file
 input_csv_file_path = "PATH_TO_INPUT_CSV_FILE"  # Insert path to your input CSV file
 output_csv_file_path = "PATH_TO_OUTPUT_CSV_FILE"  # Insert path to desired output CSV file
 
-# Search for matches, append lexicon categories, and write to output CSV
+# Search for matches and write the matching rows with their lexicon categories
 search_and_append_lexicon_category(lexicon_file_path, input_csv_file_path, output_csv_file_path)
 
 print("Lexicon matching and appending completed.")